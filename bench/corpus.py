@@ -0,0 +1,213 @@
+"""
+
+    bench.corpus -- fixture corpus for benchmarks
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Generates pages modelled after common kinds of real-world pages into
+    ``CORPUS/<kind>/<n>.html``: news articles, blog posts, forum threads and
+    huge single page applications. Pages are generated deterministically, so
+    results are comparable between runs. Stored real pages can be put into
+    the same layout instead.
+
+    usage: python bench/corpus.py [CORPUS] [N]
+
+"""
+
+import os
+import sys
+import json
+import random
+
+KINDS = ('news', 'blog', 'forum', 'spa')
+
+WORDS = (
+    'the of and to in is was for that on with as by at from this it are be an'
+    ' or have not government market city river people story article reported'
+    ' officials said analysis growth data week year company police school'
+    ' water report minister council season team public health price energy'
+    ).split()
+
+class _Page(object):
+
+    def __init__(self, seed):
+        self.r = random.Random(seed)
+        self.seed = seed
+        self.out = []
+
+    def words(self, lo, hi=None):
+        n = lo if hi is None else self.r.randint(lo, hi)
+        return ' '.join(self.r.choice(WORDS) for _ in range(n))
+
+    def name(self):
+        return '%s %s' % (self.words(1).title(), self.words(1).title())
+
+    def w(self, s):
+        self.out.append(s)
+
+    def head(self, title, author=None, image=None, scripts=3):
+        self.w('<!doctype html><html><head><meta charset="utf-8">')
+        self.w('<title>%s | Example Site</title>' % title)
+        self.w('<meta property="og:title" content="%s">' % title)
+        if author:
+            self.w('<meta name="author" content="%s">' % author)
+        if image:
+            self.w('<meta property="og:image" content="%s">' % image)
+            self.w('<meta name="twitter:image" content="%s">' % image)
+        self.w('<link rel="stylesheet" href="/static/site.css">')
+        for n in range(scripts):
+            self.w('<script src="/static/bundle%d.js"></script>' % n)
+        self.w('<style>.a{color:red}</style></head>')
+
+    def nav(self, n=12):
+        self.w('<header class="site-header"><nav class="menu"><ul>')
+        for i in range(n):
+            self.w('<li class="menu-item"><a href="/section/%d">%s</a></li>'
+                % (i, self.words(1, 2)))
+        self.w('</ul></nav></header>')
+
+    def paragraphs(self, n, images=0.1, links=0.3):
+        for i in range(n):
+            if self.r.random() < images:
+                self.w('<figure><img src="/img/%d_%d.jpg" alt="%s">'
+                    '<figcaption>%s</figcaption></figure>'
+                    % (self.seed, i, self.words(3), self.words(5, 12)))
+            if self.r.random() < links:
+                self.w('<p>%s <a href="/story/%d">%s</a> %s.</p>'
+                    % (self.words(10, 60), i, self.words(2, 5),
+                        self.words(5, 30)))
+            else:
+                self.w(u'<p>%s \u2014 %s.</p>'
+                    % (self.words(20, 90), self.words(3, 10)))
+
+    def footer(self):
+        self.w('<footer class="site-footer"><div class="links">')
+        for i in range(20):
+            self.w('<a href="/about/%d">%s</a> ' % (i, self.words(1, 2)))
+        self.w('</div><p class="copyright">&copy; Example Site</p></footer>')
+
+    def html(self):
+        return u''.join(self.out).encode('utf-8')
+
+def news(seed):
+    p = _Page(seed)
+    title = p.words(6, 12).capitalize()
+    author = p.name()
+    p.head(title, author, '/img/lead%d.jpg' % seed)
+    p.w('<body>')
+    p.nav()
+    p.w('<main><article class="story">')
+    p.w('<h1 class="headline">%s</h1>' % title)
+    p.w('<div class="byline">By <span itemprop="author">%s</span>'
+        ' <time>2014-0%d-1%d</time></div>' % (author, seed % 9 + 1, seed % 9))
+    p.paragraphs(p.r.randint(15, 40))
+    p.w('</article><aside class="related"><h3>Related</h3><ul>')
+    for i in range(10):
+        p.w('<li><a href="/related/%d">%s</a></li>' % (i, p.words(5, 9)))
+    p.w('</ul></aside>')
+    p.w('<section class="comments"><h3>Comments</h3>')
+    for i in range(p.r.randint(5, 30)):
+        p.w('<div class="comment"><span class="comment-author">%s</span>'
+            '<p>%s</p></div>' % (p.name(), p.words(5, 40)))
+    p.w('</section></main>')
+    p.footer()
+    p.w('</body></html>')
+    return p.html()
+
+def blog(seed):
+    p = _Page(seed)
+    title = p.words(4, 9).capitalize()
+    author = p.name()
+    p.head(title, image='/uploads/%d.png' % seed if seed % 2 else None)
+    p.w('<body class="post-template"><div id="wrapper">')
+    p.nav(6)
+    p.w('<div id="content"><div class="post"><h2 class="entry-title">%s</h2>'
+        % title)
+    p.w('<div class="entry-meta">Posted by <a rel="author" href="/me">%s</a>'
+        '</div><div class="entry-content">' % author)
+    p.paragraphs(p.r.randint(5, 20), images=0.2)
+    p.w('</div><div class="tags">%s</div></div></div>' % ''.join(
+        '<a href="/tag/%d" rel="tag">%s</a> ' % (i, p.words(1))
+        for i in range(8)))
+    p.w('<div id="sidebar">')
+    for i in range(6):
+        p.w('<div class="widget"><h3>%s</h3><ul>%s</ul></div>' % (
+            p.words(1, 3), ''.join(
+                '<li><a href="/archive/%d/%d">%s</a></li>' % (i, j, p.words(2))
+                for j in range(12))))
+    p.w('</div><div id="disqus_thread">')
+    for i in range(p.r.randint(0, 40)):
+        p.w('<div class="comment-body"><cite>%s</cite><p>%s</p></div>'
+            % (p.name(), p.words(3, 50)))
+    p.w('</div></div>')
+    p.footer()
+    p.w('</body></html>')
+    return p.html()
+
+def forum(seed):
+    p = _Page(seed)
+    title = p.words(4, 10).capitalize()
+    p.head(title, scripts=6)
+    p.w('<body>')
+    p.nav(20)
+    p.w('<div class="breadcrumbs">%s</div>' % ' &raquo; '.join(
+        '<a href="/f/%d">%s</a>' % (i, p.words(1, 2)) for i in range(4)))
+    p.w('<h1 class="thread-title">%s</h1><table class="posts">' % title)
+    for i in range(p.r.randint(50, 200)):
+        p.w('<tr class="post" id="post%d"><td class="userinfo">'
+            '<a class="username" href="/u/%d">%s</a><br>'
+            '<img class="avatar" src="/avatars/%d.gif"><br>Posts: %d</td>'
+            '<td class="postbody"><div class="content">'
+            % (i, i, p.name(), i, p.r.randint(1, 9000)))
+        if i and p.r.random() < 0.3:
+            p.w('<blockquote class="quote">%s</blockquote>' % p.words(5, 40))
+        p.w('<p>%s</p>' % p.words(3, 120))
+        p.w('</div><div class="signature">%s</div></td></tr>' % p.words(2, 8))
+    p.w('</table>')
+    p.footer()
+    p.w('</body></html>')
+    return p.html()
+
+def spa(seed):
+    p = _Page(seed)
+    title = p.words(3, 6).capitalize()
+    p.head(title, image='/cdn/hero%d.jpg' % seed, scripts=20)
+    p.w('<body><div id="root" data-reactroot="">')
+    # server rendered app shell: deeply nested wrappers around little text
+    for i in range(p.r.randint(300, 600)):
+        depth = p.r.randint(3, 12)
+        p.w(''.join(
+            '<div class="css-%x c%d" data-testid="w%d">'
+            % (p.r.getrandbits(24), d, d) for d in range(depth)))
+        if p.r.random() < 0.2:
+            p.w('<span>%s</span>' % p.words(1, 6))
+        if p.r.random() < 0.05:
+            p.w('<p>%s</p>' % p.words(20, 60))
+        p.w('</div>' * depth)
+    p.w('</div>')
+    # hydration state
+    state = dict(
+        ('item%d' % i, {'id': i, 'title': p.words(3, 8), 'body': p.words(20),
+            'tags': [p.words(1) for _ in range(5)]})
+        for i in range(p.r.randint(2000, 4000)))
+    p.w('<script>window.__INITIAL_STATE__ = %s;</script>'
+        % json.dumps(state, sort_keys=True))
+    p.w('</body></html>')
+    return p.html()
+
+GENERATORS = {'news': news, 'blog': blog, 'forum': forum, 'spa': spa}
+
+def generate(path, n=5):
+    """ Generate ``n`` pages of each kind into ``path``"""
+    for kind in KINDS:
+        directory = os.path.join(path, kind)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for i in range(n):
+            with open(os.path.join(directory, '%02d.html' % i), 'wb') as f:
+                f.write(GENERATORS[kind](i))
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(__file__), 'corpus')
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    generate(path, n)
@@ -0,0 +1,225 @@
+"""
+
+    bench.run -- benchmark extraction stages over a corpus
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Runs extraction over every page of a corpus, stage by stage, in the same
+    order :func:`extracty.extract` does, and reports latency percentiles of
+    each stage, throughput and peak memory. Results can be saved as a
+    baseline and later runs compared against it: a run fails if a stage got
+    slower than allowed or if extraction output of some page changed.
+
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import hashlib
+import resource
+
+import lxml.html
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extracty import extract, extract_author, extract_title, \
+    extract_cover_image
+from extracty import content
+from extracty.context import Context
+from extracty.utils import parse_html
+
+import corpus
+
+URL = 'http://example.com/page'
+
+STAGES = (
+    'parse', 'meta', 'author', 'title', 'justext', 'cover_image',
+    'content.remove_non_content', 'content.remove_bad_by_attrs',
+    'content.remove_bad_by_classifier', 'content.clean',
+    'content.remove_empty_elements', 'content.unwrap_elements',
+    'content.rewrite_links', 'content.serialize', 'total')
+
+def load_corpus(path):
+    """ Return a sorted list of ``(name, kind, html)`` of pages in ``path``"""
+    pages = []
+    for kind in sorted(os.listdir(path)):
+        directory = os.path.join(path, kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.html'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    pages.append(('%s/%s' % (kind, name), kind, f.read()))
+    return pages
+
+def run_page(html, url=URL):
+    """ Run extraction stages over ``html``, return their timings in ms"""
+    timings = []
+    clock = [time.time()]
+
+    def lap(stage):
+        now = time.time()
+        timings.append((stage, (now - clock[0]) * 1000))
+        clock[0] = now
+
+    started = clock[0]
+    doc = parse_html(html)
+    lap('parse')
+    ctx = Context(doc, url=url)
+    ctx.meta
+    lap('meta')
+    extract_author(ctx)
+    lap('author')
+    extract_title(ctx)
+    lap('title')
+    paragraphs = ctx.paragraphs
+    lap('justext')
+    extract_cover_image(ctx, url)
+    lap('cover_image')
+    content.remove_non_content(doc)
+    lap('content.remove_non_content')
+    content.remove_bad_by_attrs(doc)
+    lap('content.remove_bad_by_attrs')
+    content.remove_bad_by_classifier(doc, paragraphs)
+    lap('content.remove_bad_by_classifier')
+    content.clean(doc, strip_attrs=False)
+    lap('content.clean')
+    content.remove_empty_elements(doc)
+    lap('content.remove_empty_elements')
+    doc = content.unwrap_elements(doc)
+    lap('content.unwrap_elements')
+    content.rewrite_links(doc, url)
+    lap('content.rewrite_links')
+    lxml.html.tostring(doc, pretty_print=True)
+    lap('content.serialize')
+    timings.append(('total', (clock[0] - started) * 1000))
+    return timings
+
+def fingerprint(html, url=URL):
+    """ Hash of extraction output for ``html``"""
+    metadata = extract(html, url)
+    return hashlib.sha1(json.dumps(metadata, sort_keys=True)).hexdigest()
+
+def percentile(values, p):
+    """ Nearest rank percentile of sorted ``values``"""
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        }
+
+def run(pages, repeat):
+    """ Benchmark ``pages``, return results as a JSON serializable dict"""
+    samples = dict((stage, []) for stage in STAGES)
+    kinds = {}
+    for _ in range(repeat):
+        for name, kind, html in pages:
+            gc.collect()
+            for stage, ms in run_page(html):
+                samples[stage].append(ms)
+                if stage == 'total':
+                    kinds.setdefault(kind, []).append(ms)
+    size = sum(len(html) for _, _, html in pages) * repeat
+    total = sum(samples['total']) / 1000
+    return {
+        'pages': len(pages),
+        'repeat': repeat,
+        'stages': dict(
+            (stage, summarize(values)) for stage, values in samples.items()),
+        'kinds': dict((kind, summarize(values))
+            for kind, values in kinds.items()),
+        'pages_per_second': len(pages) * repeat / total,
+        'mb_per_second': size / total / 1024 / 1024,
+        'peak_rss_mb':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'outputs': dict(
+            (name, fingerprint(html)) for name, _, html in pages),
+        }
+
+def report(results, out=sys.stdout):
+    out.write('%d pages x %d runs: %.1f pages/s, %.2f MB/s,'
+        ' peak memory %.1f MB\n\n' % (
+            results['pages'], results['repeat'], results['pages_per_second'],
+            results['mb_per_second'], results['peak_rss_mb']))
+    out.write('%-34s %9s %9s %9s %9s\n' % ('stage (ms)', 'mean', 'p50', 'p95',
+        'p99'))
+    rows = [(stage, results['stages'][stage]) for stage in STAGES] + \
+        [('kind: %s' % kind, stats)
+            for kind, stats in sorted(results['kinds'].items())]
+    for name, stats in rows:
+        out.write('%-34s %9.3f %9.3f %9.3f %9.3f\n' % (name, stats['mean'],
+            stats['p50'], stats['p95'], stats['p99']))
+
+def compare(results, baseline, threshold, min_delta, out=sys.stdout):
+    """ Report regressions against ``baseline``, return if there are any
+
+    A stage regresses if its median is more than ``threshold`` percents and
+    more than ``min_delta`` ms slower than in baseline.
+    """
+    failed = False
+    out.write('\n%-34s %9s %9s %8s\n' % ('p50 vs baseline (ms)', 'baseline',
+        'current', 'change'))
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        was = baseline['stages'][stage]['p50']
+        now = results['stages'][stage]['p50']
+        change = (now - was) / was * 100 if was else 0.0
+        regressed = change > threshold and now - was > min_delta
+        out.write('%-34s %9.3f %9.3f %+7.1f%%%s\n' % (stage, was, now, change,
+            '  REGRESSION' if regressed else ''))
+        failed = failed or regressed
+    out.write('peak memory: %.1f MB, baseline %.1f MB\n' % (
+        results['peak_rss_mb'], baseline['peak_rss_mb']))
+    changed = sorted(
+        name for name, digest in results['outputs'].items()
+        if baseline['outputs'].get(name, digest) != digest)
+    for name in changed:
+        out.write('output changed: %s\n' % name)
+    return failed or bool(changed)
+
+def main():
+    """usage: bench/run.py [options] [CORPUS]
+
+Benchmark extraction stages over pages in CORPUS/<kind>/*.html, a corpus is
+generated with bench/corpus.py if CORPUS (bench/corpus by default) is missing.
+
+options:
+  -n, --repeat N        runs over the corpus [default: 3]
+  --save FILE           save results as a baseline
+  --compare FILE        compare with a baseline, exit with 1 on regressions
+                        or changed extraction output
+  --threshold PCT       allowed slowdown of a stage in percents [default: 20]
+  --min-delta MS        ignore slowdowns smaller than this [default: 0.05]
+"""
+    args = docopt(main.__doc__)
+    path = args['CORPUS'] or os.path.join(os.path.dirname(__file__), 'corpus')
+    if not os.path.exists(path):
+        corpus.generate(path)
+    pages = load_corpus(path)
+    if not pages:
+        sys.exit('no pages in %s' % path)
+    results = run(pages, int(args['--repeat']))
+    report(results)
+    if args['--save']:
+        with open(args['--save'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args['--compare']:
+        with open(args['--compare']) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, float(args['--threshold']),
+                float(args['--min-delta'])):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+
+    bench.scaling -- check how extraction stages grow with document size
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Runs extraction stage by stage over synthetic documents of each shape
+    from :mod:`bench.synthetic` at doubling sizes, estimates exponent ``k``
+    of growth ``time ~ size ** k`` of each stage and fails if it exceeds the
+    bound declared for the stage in ``BOUNDS`` or ``SHAPE_BOUNDS``.
+
+"""
+
+import os
+import gc
+import sys
+import math
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from run import STAGES, run_page
+import synthetic
+
+# declared complexity of stages, as exponent of size
+BOUNDS = dict((stage, 1.0) for stage in STAGES)
+
+# overrides of bounds for shapes, jusText keeps DOM path of each paragraph,
+# which is as long as nesting is deep
+SHAPE_BOUNDS = {
+    'deep': {'justext': 2.0},
+    }
+
+# sizes to start doubling from, per shape
+START = {
+    'deep': 16,
+    'wide': 1000,
+    'paragraphs': 500,
+    'attributes': 2000,
+    }
+
+def measure(html, repeat):
+    """ Return minimum timings of stages over ``repeat`` runs in ms"""
+    best = {}
+    for _ in range(repeat):
+        gc.collect()
+        for stage, ms in run_page(html):
+            best[stage] = min(ms, best.get(stage, ms))
+    return best
+
+def growth(sizes, times):
+    """ Least squares slope of ``log(time)`` over ``log(size)``"""
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(t) for t in times]
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / \
+        sum((x - mx) ** 2 for x in xs)
+
+def check(shape, steps, repeat, tolerance, min_time, out=sys.stdout):
+    """ Measure stages over ``shape``, return names of stages out of bounds
+
+    Only sizes at which a stage takes at least ``min_time`` ms are fitted,
+    faster timings are mostly noise, and a stage is not checked unless there
+    are at least two such sizes.
+    """
+    generate = synthetic.SHAPES[shape]
+    sizes = [START[shape] * 2 ** i for i in range(steps)]
+    if shape == 'deep':
+        sizes = [s for s in sizes if s <= synthetic.MAX_DEPTH - 8]
+    timings = [measure(generate(size), repeat) for size in sizes]
+
+    out.write('\n%s: sizes %s\n' % (shape, ', '.join(map(str, sizes))))
+    bounds = dict(BOUNDS, **SHAPE_BOUNDS.get(shape, {}))
+    failed = []
+    for stage in STAGES:
+        points = [(size, t[stage]) for size, t in zip(sizes, timings)
+            if t[stage] >= min_time]
+        row = ' '.join('%9.2f' % t[stage] for t in timings)
+        if len(points) < 2:
+            out.write('  %-34s %s\n' % (stage, row))
+            continue
+        k = growth(*zip(*points))
+        over = k > bounds[stage] + tolerance
+        out.write('  %-34s %s  k=%.2f%s\n' % (stage, row, k,
+            '  OVER BOUND %.1f' % bounds[stage] if over else ''))
+        if over:
+            failed.append(stage)
+    return failed
+
+def main():
+    """usage: bench/scaling.py [options] [SHAPE...]
+
+Run extraction stages over synthetic documents of SHAPEs (all by default:
+deep, wide, paragraphs, attributes) at doubling sizes, exit with 1 if growth
+of some stage exceeds its declared complexity bound.
+
+options:
+  -s, --steps N         number of sizes [default: 4]
+  -n, --repeat N        runs per size, the fastest one counts [default: 3]
+  --tolerance K         allowed excess of growth exponent [default: 0.3]
+  --min-time MS         don't fit timings faster than this [default: 2]
+"""
+    args = docopt(main.__doc__)
+    shapes = args['SHAPE'] or sorted(synthetic.SHAPES)
+    for shape in shapes:
+        if shape not in synthetic.SHAPES:
+            sys.exit('unknown shape: %s' % shape)
+    failed = []
+    for shape in shapes:
+        failed.extend('%s: %s' % (shape, stage) for stage in check(shape,
+            int(args['--steps']), int(args['--repeat']),
+            float(args['--tolerance']), float(args['--min-time'])))
+    if failed:
+        sys.exit('\nout of bounds:\n  ' + '\n  '.join(failed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+
+    bench.synthetic -- synthetic pathological documents
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Generates documents which stress extraction as they grow: very deep
+    nesting, very wide flat lists, thousands of short paragraphs and huge
+    attribute counts. Each shape takes size ``n`` and the number of elements
+    in the document grows linearly with it.
+
+    usage: python bench/synthetic.py SHAPE N
+
+"""
+
+import sys
+
+TEXT = ('Officials said the council reported growth in the city water and'
+    ' energy market this year, the analysis of public health data shows.')
+
+# libxml2 doesn't nest elements deeper than this, ones below are flattened
+MAX_DEPTH = 256
+
+def _page(body, title='Synthetic page'):
+    return ('<!doctype html><html><head><meta charset="utf-8">'
+        '<title>%s</title></head><body>%s</body></html>' % (title, body))
+
+def deep(n):
+    """ ``n`` nested wrappers, each with a byline-like text and an image"""
+    n = min(n, MAX_DEPTH - 8)
+    opening = ''.join(
+        '<div class="wrap w%d" id="d%d">by Author %d<img src="/i/%d.png">'
+        % (i, i, i, i) for i in range(n))
+    return _page('%s<p>%s</p>%s' % (opening, TEXT * 3, '</div>' * n))
+
+def wide(n):
+    """ A flat list of ``n`` short linked items"""
+    items = ''.join(
+        '<li class="item"><a href="/item/%d">Item %d</a></li>' % (i, i)
+        for i in range(n))
+    return _page('<div class="content"><p>%s</p><ul class="list">%s</ul>'
+        '</div>' % (TEXT * 3, items))
+
+def paragraphs(n):
+    """ ``n`` short paragraphs, every fourth of them long, with images"""
+    parts = []
+    for i in range(n):
+        if i % 8 == 0:
+            parts.append('<img src="/img/%d.jpg">' % i)
+        if i % 4 == 0:
+            parts.append('<p>%s</p>' % (TEXT * 3))
+        else:
+            parts.append('<p>By Author %d</p>' % i)
+    return _page('<div class="article">%s</div>' % ''.join(parts))
+
+def attributes(n):
+    """ Paragraphs with ``n`` attributes in total, up to 100 per element"""
+    parts = []
+    for start in range(0, n, 100):
+        attrs = ''.join(
+            ' data-a%d="v%d"' % (i, i) for i in range(start, min(start + 100, n)))
+        parts.append('<p class="text" id="p%d"%s>%s</p>' % (start, attrs, TEXT))
+    return _page('<div class="article">%s</div>' % ''.join(parts))
+
+SHAPES = {
+    'deep': deep,
+    'wide': wide,
+    'paragraphs': paragraphs,
+    'attributes': attributes,
+    }
+
+if __name__ == '__main__':
+    sys.stdout.write(SHAPES[sys.argv[1]](int(sys.argv[2])))
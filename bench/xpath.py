@@ -0,0 +1,70 @@
+"""
+
+    bench.xpath -- string vs compiled XPath queries of extractors
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Runs the fixed queries extractors do per document both as strings passed
+    to ``doc.xpath()`` and as module level compiled ``XPath`` objects, prints
+    time per document for each way.
+
+    usage: python bench/xpath.py [N]
+
+"""
+
+import os
+import sys
+import timeit
+
+import lxml.html
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from extracty import content, title, utils
+
+QUERIES = [
+    ('//title', title._title_xpath),
+    ('//h1|//h2|//h3', title._headers_xpath),
+    ('|'.join('//' + tag for tag in content._non_content_tags),
+        content._non_content_xpath),
+    ('//a|//img', content._links_xpath),
+    ]
+
+def document():
+    """ Typical article page"""
+    paragraphs = ''.join(
+        '<p>Paragraph %d with <a href="/link/%d">a link</a> and some text'
+        ' in it.</p>' % (n, n) for n in range(50))
+    return lxml.html.fromstring('''
+        <html>
+            <head><title>Title</title><meta name="author" content="A"></head>
+            <body>
+                <header><h1>Site</h1></header>
+                <div class="article"><h2>Title</h2>%s</div>
+                <footer><img src="/logo.png"></footer>
+            </body>
+        </html>
+        ''' % paragraphs)
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    doc = document()
+    els = doc.xpath('//p')
+
+    def strings():
+        for query, _ in QUERIES:
+            doc.xpath(query)
+        for el in els:
+            el.xpath('.//text()')
+
+    def compiled():
+        for _, query in QUERIES:
+            query(doc)
+        for el in els:
+            utils._text_xpath(el)
+
+    for name, func in (('strings', strings), ('compiled', compiled)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print '%-10s %8.1f us/document' % (name, elapsed / number * 1e6)
+
+if __name__ == '__main__':
+    main()
@@ -10,44 +10,179 @@
 
 import re
 import urlparse
+from multiprocessing.pool import ThreadPool
 import justext
+import lxml.etree
 import lxml.html
 
 from .author import extract_author
 from .image import extract_cover_image
 from .title import extract_title
 from .content import extract_content
-from .utils import gen_matches_any, html_to_text, precedings, fetch_url
+from .context import Context
+from .batch import extract_many
+from .fetch import default_fetcher
+from .utils import gen_matches_any, html_to_text, precedings, fetch_url, \
+    open_url, parse_html, parse_stream
 
 __all__ = (
-    'extract', 'extract_author', 'extract_cover_image', 'extract_title',
-    'html_to_text')
+    'extract', 'extract_url', 'extract_urls', 'extract_many', 'extract_author',
+    'extract_cover_image', 'extract_title', 'html_to_text', 'Context',
+    'FIELDS', 'HEAD_FIELDS')
 
-def extract(doc, url, author=True, cover_image=True, title=True, content=True):
-    """ Extract metadata from HTML document"""
-    if isinstance(doc, basestring):
-        doc = lxml.html.fromstring(doc)
+FIELDS = ('author', 'title', 'cover_image', 'content')
+
+# fields which can be found in <head> of a document, title is not one of
+# them, as it's cleaned against headings in the body
+HEAD_FIELDS = ('author', 'cover_image')
+
+def select_fields(fields=None, author=True, cover_image=True, title=True,
+        content=True):
+    """ Return a set of fields to extract
+
+    :param fields:
+        iterable of field names, if provided flags are ignored
+    """
+    if fields is None:
+        flags = dict(
+            author=author, cover_image=cover_image, title=title,
+            content=content)
+        return set(k for k, v in flags.items() if v)
+    fields = set(fields)
+    unknown = fields - set(FIELDS)
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    return fields
+
+def extract(doc, url, author=True, cover_image=True, title=True, content=True,
+        fields=None, charset=None):
+    """ Extract metadata from HTML document
+
+    If only fields from ``HEAD_FIELDS`` are requested and ``doc`` is a string,
+    they are first looked up in ``<meta>`` tags of ``<head>`` only, without
+    parsing the body. The full document is processed only if some of them
+    can't be found there.
+
+    :param fields:
+        names of fields to extract, overrides flags
+    :param charset:
+        charset of ``doc`` given as a byte string, e.g. from ``Content-Type``
+        header, if not provided it is sniffed from the document
+    """
+    fields = select_fields(fields, author=author, cover_image=cover_image,
+        title=title, content=content)
+
+    if isinstance(doc, basestring) and fields <= set(HEAD_FIELDS):
+        end = _head_end_re.search(doc)
+        if end and _head_start_re.search(doc, 0, end.start()):
+            try:
+                head = parse_html(doc[:end.start()], charset)
+            except lxml.etree.ParserError:
+                head = None
+            if head is not None:
+                metadata = _extract(head, url, fields, head_only=True)
+                if _found_all(metadata, fields):
+                    return metadata
+
+    return _extract(doc, url, fields, charset)
+
+def _extract(doc, url, fields, charset=None, head_only=False):
+    """ Extract ``fields`` from ``doc``, with ``head_only`` only from
+    ``<meta>`` tags of a document cut after ``<head>``"""
+    ctx = Context(doc, url=url, charset=charset)
 
     metadata = {'url': url}
 
-    if author:
-        metadata['author'] = extract_author(doc)
+    if 'author' in fields:
+        metadata['author'] = extract_author(ctx, head_only=head_only)
 
-    if title:
-        metadata['title'] = extract_title(doc)
+    if 'title' in fields:
+        metadata['title'] = extract_title(ctx)
 
-    if cover_image:
-        extracted = extract_cover_image(doc, url)
+    if 'cover_image' in fields:
+        extracted = extract_cover_image(ctx, url, head_only=head_only)
         if extracted:
             extracted = urlparse.urljoin(url, extracted)
         metadata['cover_image'] = extracted
 
     # this should go last, because it mutates tree
-    if content:
-        metadata['content'] = extract_content(doc, url)
+    if 'content' in fields:
+        metadata['content'] = extract_content(ctx, url)
 
     return metadata
 
+def _found_all(metadata, fields):
+    return all(metadata.get(k) for k in fields)
+
+_head_end_re = re.compile(r'</head\s*>|<body[\s>]', re.I)
+_head_start_re = re.compile(r'<head[\s>]', re.I)
+
+def extract_url(url, author=True, cover_image=True, title=True, content=True,
+        fields=None, fetcher=None):
+    """ Fetch document at ``url`` and extract metadata from it
+
+    If only fields from ``HEAD_FIELDS`` are requested, download stops as soon
+    as ``<head>`` is complete and the connection is closed, unless some of
+    requested fields can't be found in ``<meta>`` tags of the head, in which case the rest of
+    document is downloaded and fields are extracted from the full document.
+    Note that fields found in the head are preferred over ones which could be
+    found in the body.
+
+    :param fields:
+        names of fields to extract, overrides flags
+    :param fetcher:
+        :class:`extracty.fetch.Fetcher` to use, the shared one by default
+    """
+    fields = select_fields(fields, author=author, cover_image=cover_image,
+        title=title, content=content)
+    head_only = fields <= set(HEAD_FIELDS)
+    response = open_url(url, fetcher=fetcher)
+    try:
+        doc, data, complete = parse_stream(response, head_only=head_only,
+            charset=response.charset)
+        metadata = _extract(doc, url, fields, head_only=not complete)
+        if complete or _found_all(metadata, fields):
+            return metadata
+        # head has no answer, read the rest of the document
+        doc = parse_html(data + response.read(), response.charset)
+        return _extract(doc, url, fields)
+    finally:
+        response.close()
+
+def extract_urls(urls, workers=32, ordered=True, fetcher=None, **options):
+    """ Fetch documents at ``urls`` and extract metadata from them
+
+    Documents are fetched by a pool of threads over a shared fetcher, which
+    limits the number of connections in flight globally and per host and
+    reuses them. Yields ``(index, metadata, error)`` triples the same way
+    :func:`extract_many` does.
+
+    :param workers:
+        number of threads, i.e. maximum number of documents being fetched
+    :param ordered:
+        yield results in order of ``urls``, otherwise as they complete
+    :param options:
+        passed to :func:`extract_url`
+    """
+    fetcher = fetcher or default_fetcher()
+    select_fields(**options) # fail early on unknown fields
+
+    def _extract_one(item):
+        index, url = item
+        try:
+            return index, extract_url(url, fetcher=fetcher, **options), None
+        except Exception, e:
+            return index, None, '%s: %s' % (e.__class__.__name__, e)
+
+    pool = ThreadPool(workers)
+    try:
+        results = (pool.imap if ordered else pool.imap_unordered)(
+            _extract_one, enumerate(urls))
+        for result in results:
+            yield result
+    finally:
+        pool.terminate()
+
 def main():
     """usage: extracty [options] SRC
 
@@ -57,25 +192,33 @@ def main():
     options:
         -h, --help          show this message and exit
         -u, --url URL       url to use in case of filename provided
+        -f, --fields FIELDS comma separated list of fields to extract
+                            (author, title, cover_image, content)
         --no-cover-image    do not extract image
         --no-author         do not extract author
         --no-title          do not extract title
+        --no-content        do not extract content
     """
     import docopt
     import urllib2
     args = docopt.docopt(main.__doc__)
 
+    options = dict(
+        author=not args['--no-author'],
+        title=not args['--no-title'],
+        cover_image=not args['--no-cover-image'],
+        content=not args['--no-content'],
+        )
+    if args['--fields']:
+        options['fields'] = [
+            f.strip() for f in args['--fields'].split(',') if f.strip()]
     if args['SRC'].lower().startswith('http'):
         url = args['SRC']
-        data = fetch_url(url)
+        metadata = extract_url(url, **options)
     else:
         url = args['--url'] or ''
         data = open(args['SRC']).read()
-    metadata = extract(data, url=url,
-        author=not args['--no-author'],
-        title=not args['--no-title'],
-        cover_image=not args['--no-cover-image'],
-        )
+        metadata = extract(data, url=url, **options)
     for k, v in metadata.items():
         v = v or ''
         print '%s\t%s' % (k, v.encode('utf8'))
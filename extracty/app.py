@@ -5,6 +5,7 @@
 
 """
 
+import os
 import urlparse
 import logging
 try:
@@ -12,24 +13,47 @@ try:
 except ImportError:
     import json
 
-from . import extract
-from .utils import fetch_url
+import justext
+
+from . import extract_url, select_fields, FIELDS
+from .cache import ResultCache, result_key
+from .singleflight import SingleFlight, KeyLocks
 
 __all__ = ('application',)
 
 # TODO: remove me
 logging.getLogger('waitress').addHandler(logging.StreamHandler())
 
+# load stoplists at worker startup instead of on the first request
+justext.preload_stoplists(['English'])
+
+# results are cached in a database shared by all workers on the host if
+# EXTRACTY_RESULT_CACHE is set to its path
+result_cache = None
+if os.environ.get('EXTRACTY_RESULT_CACHE'):
+    result_cache = ResultCache(os.environ['EXTRACTY_RESULT_CACHE'],
+        ttl=int(os.environ.get('EXTRACTY_RESULT_CACHE_TTL', 3600)))
+
+# concurrent requests for the same URL and fields are served by a single
+# extraction: threads of a worker wait for the one which does it, workers
+# wait on a per key lock and then find the result in the shared cache
+flights = SingleFlight()
+key_locks = None
+if result_cache is not None:
+    key_locks = KeyLocks(result_cache.path + '.locks')
+
 def application(environ, start_response):
     """ WSGI application"""
 
     is_view = environ['PATH_INFO'] == '/view'
 
-    def response(data, status="200 Success"):
+    def response(data, status="200 Success", cache_status=None):
         if is_view:
             headers = [('Content-type', 'text/html')]
         else:
             headers = [('Content-type', 'application/json')]
+        if cache_status:
+            headers.append(('X-Extracty-Cache', cache_status))
         start_response(str(status), headers)
         return [json.dumps(data)] if not is_view else data.encode('utf8')
 
@@ -37,21 +61,51 @@ def application(environ, start_response):
         msg = {"error": message} if not is_view else message
         return response(msg, status="400 Error")
 
-    def get_result():
-        qs = urlparse.parse_qs(environ['QUERY_STRING'])
-        if not 'url' in qs:
-            return error("missing 'url' parameter")
-        kwargs = {}
-        for kw in ('cover_image', 'author', 'title'):
-            key = 'no_%s' % kw
-            if key in qs:
-                kwargs[kw] = False
-        url = qs['url'][0]
-        doc = fetch_url(url)
-        return extract(doc, url, **kwargs)
-
-    result = get_result()
-    return response(result) if not is_view else response(template % result)
+    qs = urlparse.parse_qs(environ['QUERY_STRING'])
+    if not 'url' in qs:
+        return error("missing 'url' parameter")
+    kwargs = {}
+    for kw in FIELDS:
+        key = 'no_%s' % kw
+        if key in qs:
+            kwargs[kw] = False
+    if 'fields' in qs:
+        # both ?fields=a,b and ?fields=a&fields=b are accepted
+        kwargs['fields'] = [
+            f.strip() for v in qs['fields'] for f in v.split(',') if f.strip()]
+    try:
+        fields = select_fields(**kwargs)
+    except ValueError, e:
+        return error(str(e))
+    url = qs['url'][0]
+
+    result, cache_status = flights.do(
+        result_key(url, fields), _extract_url, url, fields)
+    if not is_view:
+        return response(result, cache_status=cache_status)
+    values = dict.fromkeys(FIELDS, '')
+    values.update((k, v) for k, v in result.items() if v is not None)
+    return response(template % values, cache_status=cache_status)
+
+def _extract_url(url, fields):
+    """ Extract ``fields`` from ``url`` through the result cache
+
+    Returns ``(result, cache_status)`` pair.
+    """
+    if result_cache is None:
+        return extract_url(url, fields=fields), None
+    key = result_key(url, fields)
+    result = result_cache.get(key)
+    if result is not None:
+        return result, 'hit'
+    with key_locks.lock(key):
+        # other worker could have done the work while we waited
+        result = result_cache.get(key)
+        if result is not None:
+            return result, 'hit'
+        result = extract_url(url, fields=fields)
+        result_cache.set(key, result)
+        return result, 'miss'
 
 template = """
 <!doctype html>
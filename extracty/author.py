@@ -6,25 +6,28 @@
 """
 
 import re
-import lxml.html
+import itertools
 from . import utils
+from .context import as_context
 
 __all__ = ('extract_author',)
 
-def extract_author(doc):
+def extract_author(doc, head_only=False):
     """ Extract authorship from ``doc``
 
     :param doc:
-        HTML document as a string or as a parsed
+        HTML document as a string, as a parsed or as an analysis context
+    :param head_only:
+        look only at ``<meta>`` tags, for ``doc`` which is just a ``<head>``
     """
 
-    if isinstance(doc, basestring):
-        doc = lxml.html.fromstring(doc)
+    ctx = as_context(doc)
+    doc = ctx.doc
 
     def _find_meta(doc):
         """ Inspect <meta> tags"""
         for name in ('author', 'blogger', 'creator', 'publisher'):
-            metas = doc.xpath('//meta[@name="%s"]' % name)
+            metas = ctx.meta.find('name', name)
             for meta in metas:
                 text = meta.attrib.get('content')
 
@@ -39,12 +42,12 @@ def extract_author(doc):
 
     def _find_itemprop(doc):
         """ Inspect HTML5 itemprop microdata"""
-        es = doc.xpath('//*[@itemprop="author"]')
+        es = ctx.meta.find('itemprop', 'author')
         for e in es:
             text = utils.html_to_text(e)
             if text:
                 return text
-        es = doc.xpath('//*[@itemprop="creator"]')
+        es = ctx.meta.find('itemprop', 'creator')
         for e in es:
             text = utils.html_to_text(e)
             if text:
@@ -52,7 +55,7 @@ def extract_author(doc):
 
     def _find_rel(doc):
         """ Inspect rel attributes"""
-        es = doc.xpath('//*[@rel="author"]')
+        es = ctx.meta.find('rel', 'author')
         for e in es:
             text = utils.html_to_text(e)
             if text:
@@ -64,14 +67,25 @@ def extract_author(doc):
         Use either id and class names or content itself
         """
 
-        # holds (text, textparts, weight) pairs
-        seen = []
+        # candidates as (text, textparts, weight) by order of appearance,
+        # and orders of candidates by trigrams of their text
+        seen = {}
+        by_trigram = {}
+        order = itertools.count()
+
+        stats = utils.text_stats(doc)
 
         # if we encounter comments - skip entire subtree
         skip = lambda e: utils.matches_attr(_comment_classes, e, 'class', 'id')
         for e in utils.depth_first(doc, skip=skip):
             weight = 0
-            text = utils.html_to_text(e)
+            (text_length, has_text, _) = stats[e]
+
+            # text length from stats never exceeds the real one
+            if text_length > 80:
+                continue
+
+            text = utils.html_to_text(e) if has_text else ''
 
             if len(text) > 80:
                 continue
@@ -89,18 +103,30 @@ def extract_author(doc):
                 weight += 1
 
             if weight > 0:
-                # check if this element specialize its parent
+                # check if this element specialize its parent: candidates
+                # which contain its text are replaced, they are looked up
+                # among ones which have its rarest trigram
+                trigrams = _trigrams(text)
+                if trigrams:
+                    found = min(
+                        (by_trigram.get(g, ()) for g in trigrams), key=len)
+                else:
+                    found = seen.keys()
                 prev_weight = 0
-                for (el, _p, _w) in seen[:]:
-                    if text in el:
+                for o in list(found):
+                    (t, _p, _w) = seen[o]
+                    if text in t:
                         prev_weight = max(_w, prev_weight)
-                        seen.remove((el, _p, _w))
-                seen.append((text, list(e.itertext()),
-                    max(weight, prev_weight)))
+                        del seen[o]
+                        for g in _trigrams(t):
+                            by_trigram[g].discard(o)
+                o = next(order)
+                seen[o] = (text, list(e.itertext()), max(weight, prev_weight))
+                for g in trigrams:
+                    by_trigram.setdefault(g, set()).add(o)
 
         if seen:
-            seen.sort(key=lambda (t, p, w): -w)
-            (t, p, _) = seen[0]
+            (t, p, _) = seen[min(seen, key=lambda o: (-seen[o][2], o))]
             return (t, p)
 
     def _best_part(parts):
@@ -131,7 +157,11 @@ def extract_author(doc):
         author = _best_part(parts)
         return author.strip() if author else None
 
-    for finder in (_find_itemprop, _find_meta, _find_heueristics, _find_rel):
+    if head_only:
+        finders = (_find_meta,)
+    else:
+        finders = (_find_itemprop, _find_meta, _find_heueristics, _find_rel)
+    for finder in finders:
         maybe_author = finder(doc)
         if maybe_author is not None:
             if isinstance(maybe_author, tuple):
@@ -156,6 +186,9 @@ _author_classes_banned = utils.gen_matches_any(
     'tag',
     )
 
+def _trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
 _comment_classes = utils.gen_matches_any(
     'comment', 'discus', 'disqus', 'pingback')
 
@@ -0,0 +1,245 @@
+"""
+
+    extracty.batch -- parallel extraction over many documents
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import time
+import signal
+import select
+import itertools
+import collections
+import traceback
+import multiprocessing
+
+import justext
+
+import extracty
+
+__all__ = ('extract_many',)
+
+def extract_many(items, workers=None, chunksize=16, ordered=True,
+        timeout=None, stoplists=('English',), **options):
+    """ Extract metadata from many documents over a pool of processes
+
+    Yields ``(index, metadata, error)`` triples, where ``index`` is a position
+    of an item in ``items``, ``metadata`` is what :func:`extracty.extract` returned for
+    it or ``None`` if extraction failed, in which case ``error`` describes the
+    failure.
+
+    :param items:
+        iterable of ``(html, url)`` pairs, consumed lazily
+    :param workers:
+        number of worker processes (defaults to number of CPUs)
+    :param chunksize:
+        number of items sent to a worker at once
+    :param ordered:
+        yield results in order of ``items``, otherwise as they complete
+    :param timeout:
+        time limit in seconds for a single item, a worker which exceeds it is
+        killed and replaced, so an item which hangs doesn't block the batch
+    :param stoplists:
+        stoplists to load in each worker on startup
+    :param options:
+        passed to :func:`extracty.extract`
+    """
+    workers = workers or multiprocessing.cpu_count()
+    pool = _Pool(workers, timeout, stoplists, options)
+    try:
+        results = pool.run(enumerate(items), chunksize)
+        if not ordered:
+            for result in results:
+                yield result
+        else:
+            waiting = {}
+            expected = 0
+            for result in results:
+                waiting[result[0]] = result
+                while expected in waiting:
+                    yield waiting.pop(expected)
+                    expected += 1
+    finally:
+        pool.close()
+
+class _Worker(object):
+    """ Worker process with its own task queue and result pipe
+
+    Results are written to the pipe synchronously, so whatever a worker
+    reported before it died can still be read.
+    """
+
+    def __init__(self, stoplists, options):
+        self.tasks = multiprocessing.Queue()
+        self.results, writer = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=_work, args=(
+            self.tasks, writer, stoplists, options))
+        self.process.daemon = True
+        self.process.start()
+        # the pipe reports EOF only once all writing ends are closed
+        writer.close()
+        self.chunks = collections.deque() # ids of chunks sent to worker
+        self.started = None # (chunk id, index, start time) of current item
+        self.eof = False
+
+    def fileno(self):
+        return self.results.fileno()
+
+    def discard(self):
+        self.tasks.cancel_join_thread()
+        self.tasks.close()
+        self.results.close()
+
+class _Pool(object):
+    """ Worker processes which track items they work on
+
+    Each worker gets chunks through its own queue and reports each item it
+    starts, so when a worker exceeds the time limit or dies, the item it was
+    busy with is reported as failed and the rest of chunks it was sent are
+    sent to other workers.
+    """
+
+    def __init__(self, size, timeout, stoplists, options):
+        self.size = size
+        self.timeout = timeout
+        self.stoplists = stoplists
+        self.options = options
+        self.workers = []
+        self.chunks = {} # chunk id -> {index: item} of not completed items
+        self.pending = collections.deque() # ids of chunks not sent yet
+        self.chunk_ids = itertools.count()
+        for _ in range(size):
+            self.workers.append(_Worker(stoplists, options))
+
+    def _submit(self, chunk):
+        chunk_id = next(self.chunk_ids)
+        self.chunks[chunk_id] = dict(chunk)
+        self.pending.append(chunk_id)
+
+    def _assign(self):
+        """ Send pending chunks to workers, keeping a couple per worker"""
+        for worker in self.workers:
+            while self.pending and len(worker.chunks) < 2:
+                chunk_id = self.pending.popleft()
+                worker.chunks.append(chunk_id)
+                worker.tasks.put(
+                    (chunk_id, sorted(self.chunks[chunk_id].items())))
+
+    def run(self, items, chunksize):
+        """ Process ``(index, (html, url))`` pairs, yield results"""
+        items = iter(items)
+        exhausted = False
+        poll = min(self.timeout, 0.5) if self.timeout else 0.5
+        while True:
+            # keep a couple of chunks per worker queued
+            while not exhausted and len(self.chunks) < self.size * 2:
+                chunk = list(itertools.islice(items, chunksize))
+                if chunk:
+                    self._submit(chunk)
+                else:
+                    exhausted = True
+            if exhausted and not self.chunks:
+                return
+            self._assign()
+            ready, _, _ = select.select(self.workers, [], [], poll)
+            for worker in ready:
+                for result in self._drain(worker):
+                    yield result
+            for result in self._check_workers():
+                yield result
+
+    def _drain(self, worker):
+        """ Handle all results ``worker`` has reported so far"""
+        while not worker.eof:
+            try:
+                if not worker.results.poll():
+                    return
+                message = worker.results.recv()
+            except (EOFError, IOError):
+                worker.eof = True
+                return
+            result = self._handle(worker, message)
+            if result is not None:
+                yield result
+
+    def _handle(self, worker, message):
+        kind, chunk_id, index = message[:3]
+        if kind == 'start':
+            worker.started = (chunk_id, index, time.time())
+            return None
+        worker.started = None
+        result = self._complete(chunk_id, index, *message[3:])
+        # chunks are worked on in order they were sent
+        while worker.chunks and worker.chunks[0] not in self.chunks:
+            worker.chunks.popleft()
+        return result
+
+    def _complete(self, chunk_id, index, metadata, error):
+        pending = self.chunks.get(chunk_id)
+        if pending is None or index not in pending:
+            # already reported as failed
+            return None
+        del pending[index]
+        if not pending:
+            del self.chunks[chunk_id]
+        return (index, metadata, error)
+
+    def _check_workers(self):
+        """ Replace workers which died or exceeded the time limit"""
+        now = time.time()
+        for worker in self.workers[:]:
+            process = worker.process
+            if worker.eof or not process.is_alive():
+                process.join()
+                error = 'worker died with exit code %s' % process.exitcode
+            elif (
+                    self.timeout is not None and worker.started is not None
+                    and now - worker.started[2] > self.timeout):
+                error = 'timed out after %s seconds' % self.timeout
+                process.terminate()
+                process.join()
+            else:
+                continue
+            # results the worker reported before it was gone
+            for result in self._drain(worker):
+                yield result
+            worker.discard()
+            self.workers.remove(worker)
+            self.workers.append(_Worker(self.stoplists, self.options))
+            if worker.started is not None:
+                chunk_id, index, _ = worker.started
+                result = self._complete(chunk_id, index, None, error)
+                if result is not None:
+                    yield result
+            # items of chunks which worker hadn't got to, to be sent first
+            self.pending.extendleft(reversed(
+                [c for c in worker.chunks if c in self.chunks]))
+
+    def close(self):
+        for worker in self.workers:
+            worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.discard()
+        self.workers = []
+
+def _work(tasks, results, stoplists, options):
+    """ Worker process loop"""
+    # let parent handle interruption
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    justext.preload_stoplists(stoplists)
+    for chunk_id, chunk in iter(tasks.get, None):
+        for index, (html, url) in chunk:
+            results.send(('start', chunk_id, index))
+            try:
+                metadata = extracty.extract(html, url, **options)
+                error = None
+            except Exception, e:
+                metadata = None
+                error = '%s: %s' % (e.__class__.__name__, e)
+                if os.environ.get('EXTRACTY_DEBUG'):
+                    traceback.print_exc()
+            results.send(('done', chunk_id, index, metadata, error))
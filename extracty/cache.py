@@ -0,0 +1,227 @@
+"""
+
+    extracty.cache -- extraction results cache shared between processes
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import time
+import sqlite3
+import threading
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+__all__ = (
+    'ResultCache', 'ImageSizeCache', 'result_key',
+    'default_image_size_cache')
+
+def result_key(url, fields):
+    """ Cache key for results of extracting ``fields`` from ``url``"""
+    return '%s %s' % (','.join(sorted(fields)), url)
+
+class _SQLiteCache(object):
+    """ Base for caches in an SQLite database shared between processes
+
+    Each thread uses its own connection. Subclasses define ``schema`` and
+    ``table`` name, its ``created`` column is used to trim old entries.
+    """
+
+    table = None
+    schema = ()
+
+    # how many stores to do between checks of the number of entries
+    trim_every = 64
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stores = 0
+        db = self._db()
+        with db:
+            for statement in self.schema:
+                db.execute(statement)
+
+    def _db(self):
+        # connections can't be shared between threads nor survive a fork
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _stored(self):
+        self._stores += 1
+        if self._stores % self.trim_every == 0:
+            self.trim()
+
+    def trim(self):
+        """ Remove expired entries and ones over the size limit"""
+        db = self._db()
+        with db:
+            self._remove_expired(db)
+            db.execute(
+                'DELETE FROM %s WHERE rowid IN ('
+                ' SELECT rowid FROM %s ORDER BY created DESC'
+                ' LIMIT -1 OFFSET ?)' % (self.table, self.table),
+                (self.max_entries,))
+
+    def _remove_expired(self, db):
+        pass
+
+    def clear(self):
+        """ Remove all entries"""
+        db = self._db()
+        with db:
+            db.execute('DELETE FROM %s' % self.table)
+
+class ResultCache(_SQLiteCache):
+    """ Cache of extraction results in an SQLite database
+
+    All processes which open the same database share cached results. Entries
+    expire after ``ttl`` seconds, once there are more than ``max_entries`` of
+    them the oldest are removed.
+
+    :param path:
+        path to the database file, created if missing
+    :param ttl:
+        time in seconds for entries to live
+    :param max_entries:
+        maximum number of entries
+    """
+
+    table = 'results'
+    schema = (
+        'CREATE TABLE IF NOT EXISTS results ('
+        ' key TEXT PRIMARY KEY, value TEXT NOT NULL,'
+        ' created REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS results_created ON results (created)',
+        )
+
+    def __init__(self, path, ttl=3600, max_entries=100000):
+        self.ttl = ttl
+        super(ResultCache, self).__init__(path, max_entries)
+
+    def get(self, key):
+        """ Return cached value for ``key`` or ``None``"""
+        row = self._db().execute(
+            'SELECT value FROM results WHERE key = ? AND created > ?',
+            (key, time.time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """ Store JSON serializable ``value`` under ``key``"""
+        db = self._db()
+        with db:
+            db.execute(
+                'INSERT OR REPLACE INTO results (key, value, created)'
+                ' VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time()))
+        self._stored()
+
+    def _remove_expired(self, db):
+        db.execute('DELETE FROM results WHERE created <= ?',
+            (time.time() - self.ttl,))
+
+class ImageSizeCache(_SQLiteCache):
+    """ Cache of image dimensions and failures to get them
+
+    Failures are cached separately from sizes with their own time to live:
+    ``not_found`` for images which are missing or can't be decoded,
+    ``timeout`` for ones which didn't respond in time. Number of hits and
+    misses is counted per process.
+
+    :param path:
+        path to the database file, created if missing
+    :param ttl:
+        time in seconds for image sizes to live
+    :param not_found_ttl:
+        time in seconds to remember images which are missing
+    :param timeout_ttl:
+        time in seconds to remember images which timed out
+    :param max_entries:
+        maximum number of entries
+    """
+
+    table = 'image_sizes'
+    schema = (
+        'CREATE TABLE IF NOT EXISTS image_sizes ('
+        ' url TEXT PRIMARY KEY, width INTEGER, height INTEGER,'
+        ' failure TEXT, created REAL NOT NULL, expires REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS image_sizes_created'
+        ' ON image_sizes (created)',
+        )
+
+    def __init__(self, path, ttl=7 * 24 * 3600, not_found_ttl=24 * 3600,
+            timeout_ttl=600, max_entries=1000000):
+        self.ttls = {
+            None: ttl, 'not_found': not_found_ttl, 'timeout': timeout_ttl}
+        self.hits = 0
+        self.misses = 0
+        super(ImageSizeCache, self).__init__(path, max_entries)
+
+    def get(self, url):
+        """ Return ``(size, failure)`` pair cached for ``url`` or ``None``
+
+        Either ``size`` is a ``(width, height)`` pair or ``failure`` is one of
+        ``not_found`` or ``timeout``.
+        """
+        row = self._db().execute(
+            'SELECT width, height, failure FROM image_sizes'
+            ' WHERE url = ? AND expires > ?',
+            (url, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        width, height, failure = row
+        if failure is not None:
+            return None, failure
+        return (width, height), None
+
+    def set(self, url, size=None, failure=None):
+        """ Store ``size`` of image at ``url`` or a ``failure`` to get it"""
+        width, height = size if size is not None else (None, None)
+        now = time.time()
+        db = self._db()
+        with db:
+            db.execute(
+                'INSERT OR REPLACE INTO image_sizes'
+                ' (url, width, height, failure, created, expires)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (url, width, height, failure, now, now + self.ttls[failure]))
+        self._stored()
+
+    def stats(self):
+        """ Return hit and miss counts of this process"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _remove_expired(self, db):
+        db.execute('DELETE FROM image_sizes WHERE expires <= ?',
+            (time.time(),))
+
+_default_image_size_cache = None
+_default_image_size_cache_lock = threading.Lock()
+
+def default_image_size_cache():
+    """ Image size cache shared by the whole process
+
+    The cache is stored in a database at a path set by
+    ``EXTRACTY_IMAGE_SIZE_CACHE`` environment variable, ``None`` is returned
+    if it isn't set.
+    """
+    global _default_image_size_cache
+    path = os.environ.get('EXTRACTY_IMAGE_SIZE_CACHE')
+    if path and _default_image_size_cache is None:
+        with _default_image_size_cache_lock:
+            if _default_image_size_cache is None:
+                _default_image_size_cache = ImageSizeCache(path)
+    return _default_image_size_cache
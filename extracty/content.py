@@ -5,12 +5,13 @@
 
 """
 
+import lxml.etree
 import lxml.html
 import lxml.builder
 import urlparse
-import justext
 
-from .utils import html_to_text, gen_matches_any, matches_attr
+from .utils import text_stats, gen_matches_any, matches_attr
+from .context import as_context
 
 __all__ = ('extract_content',)
 
@@ -18,18 +19,22 @@ def extract_content(doc, url, html=True):
     """ Extract content from ``doc``
 
     :param doc:
-        HTML as a string or as ElementTree node
+        HTML as a string, as ElementTree node or as an analysis context
     :param url:
         URL of a document
     :param html:
         if we need to return HTML (default to true)
     """
-    if isinstance(doc, basestring):
-        doc = lxml.html.fromstring(doc)
+    ctx = as_context(doc, url=url)
+    doc = ctx.doc
+
+    # classify before we start to mutate tree, paragraphs keep references to
+    # their elements so they survive removals below
+    paragraphs = ctx.paragraphs
 
     remove_non_content(doc)
     remove_bad_by_attrs(doc)
-    remove_bad_by_classifier(doc)
+    remove_bad_by_classifier(doc, paragraphs)
 
     clean(doc, strip_attrs=False)
 
@@ -41,48 +46,61 @@ def extract_content(doc, url, html=True):
     return lxml.html.tostring(doc, pretty_print=True)
 
 def remove_empty_elements(doc):
+    stats = text_stats(doc)
     to_delete = []
     for el in doc.iter():
+        (_, has_text, has_image) = stats[el]
         # just left those have imgs
-        if el.tag == 'img' or el.xpath('.//img'):
+        if has_image:
             continue
-        if not html_to_text(el).strip():
+        if not has_text:
             to_delete.append(el)
     for el in reversed(to_delete):
         if el.getparent() is not None:
             el.drop_tree()
 
 def remove_non_content(doc):
-    tags = 'head link style script noscript meta iframe header footer'.split()
-    xpath = '|'.join('//' + tag for tag in tags)
-    for el in doc.xpath(xpath):
+    for el in _non_content_xpath(doc):
         if el.getparent() is not None:
             el.drop_tree()
 
-def remove_bad_by_classifier(doc):
-    ps = justext.justext(
-        doc, justext.get_stoplist('English'))
+def remove_bad_by_classifier(doc, paragraphs=None):
+    ps = paragraphs if paragraphs is not None else as_context(doc).paragraphs
     to_delete = []
-    good = []
+    # elements on paths from the root to good paragraphs, this is a prefix
+    # trie of good paths with elements as its nodes: a bad element is a
+    # prefix of some good path if and only if it is in the set
+    good = set()
     for p in ps:
+        el = p['element']
+        if el is None:
+            continue
         if p['class'] == 'bad':
-            for el in doc.xpath(p['xpath']):
-                to_delete.append((el, p['xpath']))
+            to_delete.append(el)
         elif p['class'] == 'good':
-            good.append(p['xpath'])
+            while el is not None and el not in good:
+                good.add(el)
+                el = el.getparent()
 
-    for el, xp in reversed(to_delete):
-        if el.getparent() is not None and not any(xp in g for g in good):
+    for el in reversed(to_delete):
+        if el.getparent() is not None and not el in good:
             el.drop_tree()
 
 def remove_bad_by_attrs(doc):
+    # elements which have good attrs themselves or in any of descendants,
+    # propagated from children to parents
+    has_good = set()
+    for _, el in lxml.etree.iterwalk(doc, events=('end',)):
+        if (
+            any(child in has_good for child in el)
+            or matches_attr(_good_attr_re, el, 'class', 'id')):
+            has_good.add(el)
+
     to_delete = []
     for el in doc.iter():
         if (
-            matches_attr(_bad_attr_re, el, 'class', 'id')
-            and not any(
-                matches_attr(_good_attr_re, x, 'class', 'id')
-                for x in el.iter())):
+            el not in has_good
+            and matches_attr(_bad_attr_re, el, 'class', 'id')):
             to_delete.append(el)
 
     for el in reversed(to_delete):
@@ -124,12 +142,20 @@ def unwrap_elements(doc):
     return doc
 
 def rewrite_links(doc, url):
-    for link in doc.xpath('//a|//img'):
+    for link in _links_xpath(doc):
         if link.attrib.get('href'):
             link.attrib['href'] = urlparse.urljoin(url, link.attrib['href'])
         if link.attrib.get('src'):
             link.attrib['src'] = urlparse.urljoin(url, link.attrib['src'])
 
+_non_content_tags = (
+    'head link style script noscript meta iframe header footer'.split())
+
+_non_content_xpath = lxml.etree.XPath(
+    '|'.join('//' + tag for tag in _non_content_tags))
+
+_links_xpath = lxml.etree.XPath('//a|//img')
+
 _bad_attr_re = gen_matches_any(
     'combx',
     'comment',
@@ -0,0 +1,125 @@
+"""
+
+    extracty.context -- per-document analysis context
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import heapq
+import lxml.etree
+import justext
+
+from .utils import parse_html
+
+__all__ = ('Context', 'MetaIndex', 'as_context')
+
+class Context(object):
+    """ Analysis context of a single document
+
+    Holds the parsed tree and everything derived from it which is shared
+    between extractors, so each piece of analysis is done once per document.
+
+    :param doc:
+        HTML document as a string or as a parsed
+    :param url:
+        URL of a document
+    :param stoplist:
+        stoplist to use for jusText classification (defaults to English)
+    :param charset:
+        charset of a document given as a byte string
+    """
+
+    def __init__(self, doc, url=None, stoplist=None, charset=None):
+        if isinstance(doc, basestring):
+            doc = parse_html(doc, charset)
+        self.doc = doc
+        self.url = url
+        self._stoplist = stoplist
+        self._paragraphs = None
+        self._meta = None
+
+    @property
+    def stoplist(self):
+        """ Stoplist used for jusText classification"""
+        if self._stoplist is None:
+            self._stoplist = justext.get_stoplist('English')
+        return self._stoplist
+
+    @property
+    def meta(self):
+        """ :class:`MetaIndex` of the document"""
+        if self._meta is None:
+            self._meta = MetaIndex(self.doc)
+        return self._meta
+
+    @property
+    def paragraphs(self):
+        """ jusText classified paragraphs of the document
+
+        Classification is done on the first access, paragraphs refer to their
+        source elements directly, so they stay usable after the tree is
+        mutated.
+
+        Note that jusText preprocessing removes ``<head>``, ``<script>`` and
+        ``<style>`` elements from the tree.
+        """
+        if self._paragraphs is None:
+            # index metadata before <head> is gone
+            self.meta
+            self._paragraphs = justext.justext(self.doc, self.stoplist)
+        return self._paragraphs
+
+class MetaIndex(object):
+    """ Index of metadata carrying elements of a document
+
+    Built in one pass over the document, maps values of ``name`` and
+    ``property`` attributes of ``<meta>`` elements and values of ``itemprop``
+    and ``rel`` attributes of any elements to the elements. The whole document
+    is indexed even if ``doc`` is an element inside it, the same way ``//``
+    XPath queries search it.
+    """
+
+    # attributes indexed on any element
+    attrs = ('itemprop', 'rel')
+
+    # attributes indexed on <meta> elements
+    meta_attrs = ('name', 'property')
+
+    def __init__(self, doc):
+        index = {} # (attr, value) -> [(position, element), ...]
+        root = doc.getroottree().getroot()
+        for position, el in enumerate(root.iter(lxml.etree.Element)):
+            attrib = el.attrib
+            if not attrib:
+                continue
+            if el.tag == 'meta':
+                for attr in self.meta_attrs:
+                    value = attrib.get(attr)
+                    if value is not None:
+                        index.setdefault((attr, value), []).append(
+                            (position, el))
+            for attr in self.attrs:
+                value = attrib.get(attr)
+                if value is not None:
+                    index.setdefault((attr, value), []).append((position, el))
+        self._index = index
+
+    def find(self, attr, *values):
+        """ Return elements which have ``attr`` equal to any of ``values``
+
+        Elements are returned in document order.
+        """
+        found = [self._index.get((attr, value), ()) for value in values]
+        if len(found) == 1:
+            return [el for _, el in found[0]]
+        return [el for _, el in heapq.merge(*found)]
+
+def as_context(doc, url=None):
+    """ Return analysis context for ``doc``
+
+    :param doc:
+        HTML document as a string, as a parsed or an existing context
+    """
+    if isinstance(doc, Context):
+        return doc
+    return Context(doc, url=url)
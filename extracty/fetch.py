@@ -0,0 +1,429 @@
+"""
+
+    extracty.fetch -- HTTP fetching with connection reuse
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import re
+import time
+import socket
+import httplib
+import urlparse
+import threading
+
+from .httpcache import HTTPCache
+
+__all__ = (
+    'Fetcher', 'Response', 'CachedResponse', 'FetchError',
+    'ResponseTooLarge', 'content_charset', 'default_fetcher')
+
+USER_AGENT = (
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8)'
+    ' AppleWebKit/536.25 (KHTML, like Gecko)'
+    ' Version/6.0 Safari/536.25')
+
+# unread bodies up to this size are read before connection is returned to
+# the pool, larger ones make the connection to be closed
+_DRAIN_SIZE = 64 * 1024
+
+class FetchError(Exception):
+    """ Request failed, ``status`` is set if server responded with an error"""
+
+    def __init__(self, message, url=None, status=None):
+        Exception.__init__(self, message)
+        self.url = url
+        self.status = status
+
+class ResponseTooLarge(FetchError):
+    """ Response body exceeds size limit"""
+
+class Fetcher(object):
+    """ Thread safe HTTP client with a pool of keep-alive connections
+
+    Number of requests in flight is limited globally and per host, a thread
+    which exceeds a limit waits for a slot, so the same fetcher can be shared
+    between any number of threads.
+
+    :param max_connections:
+        maximum number of requests in flight
+    :param max_per_host:
+        maximum number of requests in flight to a single host
+    :param connect_timeout:
+        timeout in seconds for establishing a connection
+    :param read_timeout:
+        timeout in seconds for each read from a connection
+    :param max_size:
+        maximum size of response body in bytes, ``None`` for no limit
+    :param max_redirects:
+        maximum number of redirects to follow
+    :param cache:
+        :class:`extracty.httpcache.HTTPCache` to revalidate responses against
+    :param max_idle:
+        maximum number of idle connections kept in the pool
+    :param max_idle_per_host:
+        maximum number of idle connections to a single host
+    :param idle_timeout:
+        time in seconds an idle connection is kept for
+    """
+
+    def __init__(self, max_connections=100, max_per_host=8,
+            connect_timeout=10, read_timeout=30, max_size=10 * 1024 * 1024,
+            max_redirects=5, user_agent=USER_AGENT, cache=None, max_idle=32,
+            max_idle_per_host=2, idle_timeout=30):
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_size = max_size
+        self.max_redirects = max_redirects
+        self.user_agent = user_agent
+        self.cache = cache
+        self._slots = threading.BoundedSemaphore(max_connections)
+        # (scheme, host, port) -> [semaphore, number of requests holding or
+        # waiting for it], entries are dropped once a host is not in use
+        self._host_slots = {}
+        # (scheme, host, port) -> [(release time, connection), ...]
+        self._idle = {}
+        self._idle_count = 0
+        self._lock = threading.Lock()
+
+    def open(self, url, headers=None, max_size=None):
+        """ Send GET request to ``url``, return :class:`Response`
+
+        Redirects are followed, responses with status 400 and above raise
+        :class:`FetchError`. The response holds a connection slot till it is
+        closed.
+
+        If the fetcher has a cache, a request for a cached URL carries its
+        validators and on ``304 Not Modified`` the cached body is returned,
+        responses with validators which are read till the end are cached.
+
+        :param headers:
+            additional request headers
+        :param max_size:
+            response size limit, overrides the fetcher one
+        """
+        if max_size is None:
+            max_size = self.max_size
+        for _ in range(self.max_redirects + 1):
+            entry = self.cache.get(url) if self.cache is not None else None
+            request_headers = dict(headers or {})
+            if entry is not None:
+                request_headers.update(entry.conditional_headers())
+            response = self._request(url, request_headers, max_size)
+            if response.status == 304 and entry is not None:
+                response.close()
+                self.cache.touch(url)
+                return CachedResponse(url, entry.body, entry.content_type)
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader('location')
+                response.close()
+                if not location:
+                    raise FetchError(
+                        'redirect without location', url, response.status)
+                url = urlparse.urljoin(url, location)
+                continue
+            if response.status >= 400:
+                response.close()
+                raise FetchError(
+                    'HTTP %s for %s' % (response.status, url),
+                    url, response.status)
+            if self.cache is not None and response.status == 200:
+                response.cache_to(self.cache)
+            return response
+        raise FetchError('too many redirects', url)
+
+    def fetch(self, url, headers=None, max_size=None):
+        """ Fetch ``url``, return response body"""
+        response = self.open(url, headers=headers, max_size=max_size)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def _request(self, url, headers, max_size):
+        parsed = urlparse.urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise FetchError('unsupported URL scheme: %s' % url, url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        key = (parsed.scheme, parsed.hostname, port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        request_headers = {
+            'Host': parsed.netloc.rsplit('@', 1)[-1],
+            'User-Agent': self.user_agent,
+            }
+        request_headers.update(headers)
+
+        self._acquire_host(key)
+        self._slots.acquire()
+        try:
+            conn, reused = self._connection(key)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                resp = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                # server dropped idle keep-alive connection, retry once on
+                # a fresh one
+                conn, _ = self._connection(key, fresh=True)
+                try:
+                    conn.request('GET', path, headers=request_headers)
+                    resp = conn.getresponse()
+                except:
+                    conn.close()
+                    raise
+        except:
+            self._release(key, None, False)
+            raise
+        return Response(self, key, conn, resp, url, max_size)
+
+    def _acquire_host(self, key):
+        with self._lock:
+            entry = self._host_slots.get(key)
+            if entry is None:
+                entry = self._host_slots[key] = [
+                    threading.BoundedSemaphore(self.max_per_host), 0]
+            entry[1] += 1
+        entry[0].acquire()
+
+    def _connection(self, key, fresh=False):
+        if not fresh:
+            expired = []
+            try:
+                with self._lock:
+                    idle = self._idle.get(key, [])
+                    now = time.time()
+                    while idle:
+                        released, conn = idle.pop()
+                        self._idle_count -= 1
+                        if now - released <= self.idle_timeout:
+                            return conn, True
+                        expired.append(conn)
+            finally:
+                for conn in expired:
+                    conn.close()
+        scheme, host, port = key
+        cls = httplib.HTTPSConnection if scheme == 'https' else \
+            httplib.HTTPConnection
+        conn = cls(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn, False
+
+    def _release(self, key, conn, reusable):
+        """ Return request slots, and ``conn`` to the pool if ``reusable``"""
+        to_close = []
+        if conn is not None and not reusable:
+            to_close.append(conn)
+        with self._lock:
+            now = time.time()
+            if conn is not None and reusable:
+                idle = self._idle.setdefault(key, [])
+                idle.append((now, conn))
+                self._idle_count += 1
+                if len(idle) > self.max_idle_per_host:
+                    to_close.append(idle.pop(0)[1])
+                    self._idle_count -= 1
+            to_close.extend(self._evict(now))
+            entry = self._host_slots[key]
+            entry[0].release()
+            entry[1] -= 1
+            self._forget(key)
+            self._slots.release()
+        for conn in to_close:
+            conn.close()
+
+    def _evict(self, now):
+        """ Remove idle connections which expired or exceed the total limit,
+        oldest first, return them"""
+        evicted = []
+        for key, idle in self._idle.items():
+            while idle and now - idle[0][0] > self.idle_timeout:
+                evicted.append(idle.pop(0)[1])
+        self._idle_count -= len(evicted)
+        while self._idle_count > self.max_idle:
+            key = min(
+                (k for k in self._idle if self._idle[k]),
+                key=lambda k: self._idle[k][0][0])
+            evicted.append(self._idle[key].pop(0)[1])
+            self._idle_count -= 1
+        for key in self._idle.keys():
+            self._forget(key)
+        return evicted
+
+    def _forget(self, key):
+        # drop state of a host which has no idle connections and no requests
+        if not self._idle.get(key):
+            self._idle.pop(key, None)
+            entry = self._host_slots.get(key)
+            if entry is not None and not entry[1]:
+                del self._host_slots[key]
+
+    def close(self):
+        """ Close idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._idle_count = 0
+            for key in idle:
+                self._forget(key)
+        for conns in idle.values():
+            for _, conn in conns:
+                conn.close()
+
+class Response(object):
+    """ Response of :class:`Fetcher` which is read as a file
+
+    Closing a fully read response returns its connection to the pool.
+    """
+
+    def __init__(self, fetcher, key, conn, resp, url, max_size):
+        self._fetcher = fetcher
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self._headers = resp.msg
+        self._max_size = max_size
+        self._read = 0
+        self._cache = None
+        self._chunks = None
+        self.url = url
+        self.status = resp.status
+        length = resp.getheader('content-length')
+        if max_size is not None and length and length.isdigit() \
+                and int(length) > max_size:
+            self.close()
+            raise ResponseTooLarge(
+                'response of %s bytes exceeds limit' % length, url,
+                self.status)
+
+    def getheader(self, name, default=None):
+        return self._headers.getheader(name, default)
+
+    @property
+    def charset(self):
+        """ Charset from ``Content-Type`` header or ``None``"""
+        return content_charset(self.getheader('content-type'))
+
+    def cache_to(self, cache):
+        """ Store body to ``cache`` if it is read till the end"""
+        etag = self.getheader('etag')
+        last_modified = self.getheader('last-modified')
+        if not etag and not last_modified:
+            return
+        if 'no-store' in self.getheader('cache-control', '').lower():
+            return
+        self._cache = (cache, etag, last_modified)
+        self._chunks = []
+
+    def read(self, size=None):
+        if self._resp is None:
+            return ''
+        if self._max_size is not None:
+            # read one byte over the limit to find out if it is exceeded
+            left = self._max_size - self._read + 1
+            size = left if size is None else min(size, left)
+        data = self._resp.read(size) if size is not None else \
+            self._resp.read()
+        self._read += len(data)
+        if self._max_size is not None and self._read > self._max_size:
+            self.close()
+            raise ResponseTooLarge(
+                'response exceeds %s bytes' % self._max_size, self.url,
+                self.status)
+        if self._cache is not None:
+            self._chunks.append(data)
+            if self._resp.isclosed():
+                cache, etag, last_modified = self._cache
+                self._cache = None
+                cache.store(self.url, etag, last_modified,
+                    ''.join(self._chunks), self.getheader('content-type'))
+        return data
+
+    def close(self):
+        if self._resp is None:
+            return
+        resp, self._resp = self._resp, None
+        if not resp.isclosed() and not resp.will_close \
+                and resp.length is not None and resp.length <= _DRAIN_SIZE:
+            # read the rest of a short body, e.g. of redirect, to be able to
+            # reuse the connection
+            try:
+                resp.read()
+            except (httplib.HTTPException, socket.error):
+                pass
+        reusable = resp.isclosed() and not resp.will_close
+        if not reusable:
+            resp.close()
+        self._fetcher._release(self._key, self._conn, reusable)
+
+    def __del__(self):
+        self.close()
+
+class CachedResponse(object):
+    """ Response served from cache"""
+
+    status = 200
+
+    def __init__(self, url, body, content_type=None):
+        self.url = url
+        self._body = body
+        self._pos = 0
+        self._headers = {}
+        if content_type:
+            self._headers['content-type'] = content_type
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+    @property
+    def charset(self):
+        """ Charset from ``Content-Type`` header or ``None``"""
+        return content_charset(self.getheader('content-type'))
+
+    def read(self, size=None):
+        if size is None:
+            end = len(self._body)
+        else:
+            end = min(self._pos + size, len(self._body))
+        data = self._body[self._pos:end]
+        self._pos = end
+        return data
+
+    def close(self):
+        pass
+
+_charset_re = re.compile(r';\s*charset\s*=\s*["\']?([^"\';\s]+)', re.I)
+
+def content_charset(content_type):
+    """ Return charset parameter of ``content_type`` or ``None``"""
+    if not content_type:
+        return None
+    m = _charset_re.search(content_type)
+    return m.group(1) if m else None
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+def default_fetcher():
+    """ Fetcher shared by the whole process
+
+    Responses are cached in a directory set by ``EXTRACTY_HTTP_CACHE``
+    environment variable, if it is set.
+    """
+    global _default_fetcher
+    if _default_fetcher is None:
+        with _default_fetcher_lock:
+            if _default_fetcher is None:
+                cache = None
+                if os.environ.get('EXTRACTY_HTTP_CACHE'):
+                    cache = HTTPCache(os.environ['EXTRACTY_HTTP_CACHE'])
+                _default_fetcher = Fetcher(cache=cache)
+    return _default_fetcher
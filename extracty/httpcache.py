@@ -0,0 +1,182 @@
+"""
+
+    extracty.httpcache -- on-disk cache of HTTP responses for revalidation
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import errno
+import fcntl
+import hashlib
+import tempfile
+import threading
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+__all__ = ('HTTPCache', 'CacheEntry')
+
+class CacheEntry(object):
+    """ Cached response body with its validators"""
+
+    __slots__ = ('url', 'etag', 'last_modified', 'body', 'content_type')
+
+    def __init__(self, url, etag, last_modified, body, content_type=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.content_type = content_type
+
+    def conditional_headers(self):
+        """ Request headers to revalidate the entry with"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class HTTPCache(object):
+    """ Cache of response bodies and their validators in a directory
+
+    Each entry is a file named after a hash of URL, which holds a JSON header
+    line with validators followed by the body. Entries are evicted least
+    recently used first once total size of the cache exceeds ``max_size``,
+    recency is tracked by file modification time and the total size is kept
+    in a file updated under ``flock``, so several processes can share the
+    same directory.
+
+    :param path:
+        directory to store entries in, created if missing
+    :param max_size:
+        maximum total size of entries in bytes
+    """
+
+    def __init__(self, path, max_size=256 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @property
+    def _size_filename(self):
+        return os.path.join(self.path, '.size')
+
+    def _filename(self, url):
+        if isinstance(url, unicode):
+            url = url.encode('utf8')
+        return os.path.join(self.path, hashlib.sha1(url).hexdigest())
+
+    def get(self, url):
+        """ Return :class:`CacheEntry` for ``url`` or ``None``"""
+        filename = self._filename(url)
+        try:
+            with open(filename, 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (IOError, ValueError):
+            return None
+        if header.get('url') != url:
+            # hash collision
+            return None
+        return CacheEntry(url, header.get('etag'),
+            header.get('last_modified'), body, header.get('content_type'))
+
+    def touch(self, url):
+        """ Mark entry for ``url`` as recently used"""
+        try:
+            os.utime(self._filename(url), None)
+        except OSError:
+            pass
+
+    def store(self, url, etag, last_modified, body, content_type=None):
+        """ Store ``body`` of response for ``url`` with its validators and
+        content type"""
+        header = json.dumps({
+            'url': url, 'etag': etag, 'last_modified': last_modified,
+            'content_type': content_type})
+        size = len(header) + 1 + len(body)
+        if size > self.max_size:
+            return
+        filename = self._filename(url)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write('\n')
+                f.write(body)
+            try:
+                replaced = os.path.getsize(filename)
+            except OSError:
+                replaced = 0
+            os.rename(tmp, filename)
+        except:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._update_size(size - replaced)
+
+    def _update_size(self, delta=None):
+        """ Add ``delta`` to the total size shared with other processes and
+        evict entries if it exceeds the limit, reset it with ``None``"""
+        with self._lock:
+            with open(self._size_filename, 'a+') as f:
+                # the lock is released when the file is closed
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    total = int(f.read()) + delta
+                except (TypeError, ValueError):
+                    # reset or missing, entries written so far are on disk
+                    total = sum(size for _, size, _ in self._entries())
+                if total > self.max_size:
+                    total = self._evict()
+                f.seek(0)
+                f.truncate()
+                f.write(str(total))
+
+    def _entries(self):
+        """ Iterate over ``(filename, size, mtime)`` of entries"""
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            yield filename, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """ Evict entries over the limit, return size of the rest"""
+        # the size is recounted from what is on disk, so any drift of the
+        # shared total is corrected
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for filename, size, _ in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                continue
+            total -= size
+        return total
+
+    def clear(self):
+        """ Remove all entries"""
+        for filename, _, _ in list(self._entries()):
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+        self._update_size(None)
@@ -5,32 +5,54 @@
 
 """
 
+import re
+import time
+import socket
+import struct
 import itertools
-import urllib2
+import threading
 import urlparse
 from cStringIO import StringIO
 
-import lxml.html
-import justext
 import Image
 
 from . import utils
+from .context import as_context
+from .cache import default_image_size_cache
+from .fetch import FetchError
 
-__all__ = ('extract_cover_image',)
+__all__ = ('extract_cover_image', 'image_size', 'ImageSizeError')
 
-def extract_cover_image(doc, url, paragraphs=None, min_image_size=None):
+def extract_cover_image(doc, url, paragraphs=None, min_image_size=None,
+        fetcher=None, probe_workers=4, probe_timeout=10, size_cache=None,
+        head_only=False):
     """ Extract cover image from doc
 
     :param doc:
-        HTML document as a string or as a parsed
+        HTML document as a string, as a parsed or as an analysis context
+    :param paragraphs:
+        jusText paragraphs of the document, taken from the analysis context
+        if not provided
     :param min_image_size:
         minimum allowed image size
+    :param fetcher:
+        fetcher to download images with when checking their size
+    :param probe_workers:
+        number of images to check size of concurrently
+    :param probe_timeout:
+        time limit in seconds for checking image sizes, after which the best
+        image found to be big enough so far is returned
+    :param size_cache:
+        :class:`extracty.cache.ImageSizeCache` to consult before checking
+        image sizes over network, the one configured by environment by default
+    :param head_only:
+        look only at ``<meta>`` tags, for ``doc`` which is just a ``<head>``
     """
-    if isinstance(doc, basestring):
-        doc = lxml.html.fromstring(doc)
+    ctx = as_context(doc, url=url)
+    doc = ctx.doc
 
     def _find_og_meta_image(doc):
-        metas = doc.xpath('//meta[@property="og:image"]')
+        metas = ctx.meta.find('property', 'og:image')
         if metas:
             # some open graph submitted images can be too generic, try to filter
             # them
@@ -43,25 +65,23 @@ def extract_cover_image(doc, url, paragraphs=None, min_image_size=None):
                 yield content
 
     def _find_twitter_meta_image(doc):
-        metas = doc.xpath('//meta[@name="twitter:image"]')
+        metas = ctx.meta.find('name', 'twitter:image')
         for meta in metas:
             if meta.attrib.get('content'):
                 yield meta.attrib['content']
 
     def _find_heueristics(doc):
-        ps = paragraphs or justext.justext(
-            doc, justext.get_stoplist('English'))
+        ps = paragraphs if paragraphs is not None else ctx.paragraphs
         prev = None
         images = []
         for p in ps:
             if p['class'] == 'good':
-                xpath = p['xpath']
-                e = doc.xpath(xpath)
-                if not e:
+                e = p.get('element')
+                if e is None:
                     continue
-                e = e[0]
-                for prec in utils.precedings(e,
-                        before=lambda x: prev is not None and prev is e):
+                # stop at the previous good paragraph, images before it
+                # were collected already
+                for prec in utils.precedings(e, before=lambda x: x is prev):
                     if prec.tag == 'img' and prec.attrib.get('src'):
                         images.append(prec.attrib['src'])
                 prev = e
@@ -72,29 +92,243 @@ def extract_cover_image(doc, url, paragraphs=None, min_image_size=None):
                     continue
                 yield image
 
-    funcs = (_find_og_meta_image, _find_twitter_meta_image, _find_heueristics)
-    for image in itertools.chain(*(f(doc) for f in funcs)):
-        image = urlparse.urljoin(url, image)
-        if image:
-            if min_image_size:
-                if isinstance(min_image_size, tuple):
-                    (mw, mh) = min_image_size
-                else:
-                    (mw, mh) = (min_image_size, min_image_size)
-                (w, h) = image_size(image)
-                if mw is not None and w < mw:
-                    continue
-                if mh is not None and h < mh:
-                    continue
+    def _candidates(funcs):
+        return (
+            urlparse.urljoin(url, image)
+            for image in itertools.chain(*(f(doc) for f in funcs)))
+
+    metas = (_find_og_meta_image, _find_twitter_meta_image)
+    groups = (metas,) if head_only else (metas, (_find_heueristics,))
+    images = _candidates(sum(groups, ()))
+    if not min_image_size:
+        for image in images:
+            if image:
+                return image.strip()
+        return None
+
+    if isinstance(min_image_size, tuple):
+        (mw, mh) = min_image_size
+    else:
+        (mw, mh) = (min_image_size, min_image_size)
+
+    if size_cache is None:
+        size_cache = default_image_size_cache()
+
+    def _big_enough(image):
+        (w, h) = image_size(image, fetcher=fetcher, cache=size_cache)
+        if mw is not None and w < mw:
+            return False
+        if mh is not None and h < mh:
+            return False
+        return True
+
+    # heuristics need jusText pass over the document, so their candidates
+    # are looked for only if none of ones from <meta> is big enough
+    deadline = time.time() + probe_timeout if probe_timeout is not None \
+        else None
+    for funcs in groups:
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return None
+        image = _first_passing(
+            [image for image in _candidates(funcs) if image], _big_enough,
+            workers=probe_workers, timeout=timeout)
+        if image is not None:
             return image.strip()
 
-def image_size(url):
-    data = urllib2.urlopen(url)
-    infp = StringIO()
-    infp.write(data.read())
-    infp.seek(0)
-    img = Image.open(infp)
-    return img.size
+def _first_passing(candidates, check, workers=4, timeout=None):
+    """ Return the first of ``candidates`` which passes ``check``
+
+    Candidates are checked concurrently by up to ``workers`` threads in order
+    of priority, checks of lower priority candidates are not started once
+    the winner is known, ones already running are left to finish in the
+    background. A check which raises counts as failed. If ``timeout``
+    expires, the best candidate which passed so far wins.
+    """
+    if not candidates:
+        return None
+    results = {} # candidate index -> passed
+    state = {'next': 0, 'done': False, 'winner': None}
+    cond = threading.Condition()
+
+    def _decide():
+        # the winner is known once all candidates before the first one which
+        # passed have failed
+        for idx in range(len(candidates)):
+            if idx not in results:
+                return
+            if results[idx]:
+                state['winner'] = candidates[idx]
+                break
+        state['done'] = True
+
+    def _work():
+        while True:
+            with cond:
+                if state['done'] or state['next'] >= len(candidates):
+                    return
+                idx = state['next']
+                state['next'] += 1
+            try:
+                passed = bool(check(candidates[idx]))
+            except Exception:
+                passed = False
+            with cond:
+                results[idx] = passed
+                _decide()
+                cond.notify_all()
+
+    for _ in range(min(workers, len(candidates))):
+        thread = threading.Thread(target=_work)
+        thread.daemon = True
+        thread.start()
+
+    deadline = time.time() + timeout if timeout is not None else None
+    with cond:
+        while not state['done']:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    state['done'] = True
+                    passed = [idx for idx, ok in results.items() if ok]
+                    if passed:
+                        state['winner'] = candidates[min(passed)]
+                    break
+            cond.wait(remaining)
+        return state['winner']
+
+class ImageSizeError(Exception):
+    """ Image can't be decoded to get its size"""
+
+def image_size(url, fetcher=None, max_probe=64 * 1024, cache=None):
+    """ Return ``(width, height)`` of image at ``url``
+
+    Only the beginning of an image is downloaded to read its dimensions from
+    a header of PNG, GIF, JPEG or WebP image, the whole image is downloaded
+    and opened with PIL only if that fails.
+
+    :param max_probe:
+        maximum number of bytes to read looking for a header
+    :param cache:
+        :class:`extracty.cache.ImageSizeCache` to look size up in before
+        downloading the image and to store it to, along with failures because
+        of the image missing, being broken or timing out
+    """
+    if cache is None:
+        return _probe_image_size(url, fetcher, max_probe)
+    entry = cache.get(url)
+    if entry is not None:
+        size, failure = entry
+        if failure is not None:
+            raise ImageSizeError('%s (cached)' % failure)
+        return size
+    try:
+        size = _probe_image_size(url, fetcher, max_probe)
+    except FetchError, e:
+        if e.status in (404, 410):
+            cache.set(url, failure='not_found')
+        raise
+    except ImageSizeError:
+        cache.set(url, failure='not_found')
+        raise
+    except socket.timeout:
+        cache.set(url, failure='timeout')
+        raise
+    cache.set(url, size)
+    return size
+
+def _probe_image_size(url, fetcher, max_probe):
+    response = utils.open_url(url, fetcher=fetcher)
+    try:
+        data = ''
+        while len(data) < max_probe:
+            chunk = response.read(4096)
+            if not chunk:
+                break
+            data += chunk
+            size = parse_image_size(data)
+            if size is not None:
+                return size
+            if len(data) >= 16 and not _image_signature_re.match(data):
+                break
+        data += response.read()
+    finally:
+        response.close()
+    try:
+        return Image.open(StringIO(data)).size
+    except IOError, e:
+        raise ImageSizeError(str(e))
+
+_image_signature_re = re.compile(
+    r'\x89PNG\r\n\x1a\n|GIF8[79]a|\xff\xd8|RIFF....WEBP', re.S)
+
+# JPEG start of frame markers, which hold image dimensions
+_jpeg_sof_markers = frozenset(
+    [0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce,
+    0xcf])
+
+def parse_image_size(data):
+    """ Parse ``(width, height)`` from the beginning of image ``data``
+
+    PNG, GIF, JPEG and WebP images are recognized, ``None`` is returned if
+    format isn't recognized or ``data`` is too short to contain dimensions.
+    """
+    if data[:8] == '\x89PNG\r\n\x1a\n':
+        if len(data) >= 24 and data[12:16] == 'IHDR':
+            return struct.unpack('>II', data[16:24])
+        return None
+    if data[:6] in ('GIF87a', 'GIF89a'):
+        if len(data) >= 10:
+            return struct.unpack('<HH', data[6:10])
+        return None
+    if data[:2] == '\xff\xd8':
+        return _parse_jpeg_size(data)
+    if data[:4] == 'RIFF' and data[8:12] == 'WEBP':
+        return _parse_webp_size(data)
+    return None
+
+def _parse_jpeg_size(data):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != '\xff':
+            # not at a marker, file is broken
+            return None
+        marker = ord(data[pos + 1])
+        if marker == 0xff:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xd0 <= marker <= 0xd9:
+            # markers without a segment
+            pos += 2
+            continue
+        if marker in _jpeg_sof_markers:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        length, = struct.unpack('>H', data[pos + 2:pos + 4])
+        pos += 2 + length
+    return None
+
+def _parse_webp_size(data):
+    chunk = data[12:16]
+    if chunk == 'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == 'VP8L' and len(data) >= 25:
+        b0, b1, b2, b3 = [ord(c) for c in data[21:25]]
+        width = 1 + (((b1 & 0x3f) << 8) | b0)
+        height = 1 + (((b3 & 0xf) << 10) | (b2 << 2) | ((b1 & 0xc0) >> 6))
+        return width, height
+    if chunk == 'VP8X' and len(data) >= 30:
+        width = 1 + struct.unpack('<I', data[24:27] + '\0')[0]
+        height = 1 + struct.unpack('<I', data[27:30] + '\0')[0]
+        return width, height
+    return None
 
 _image_urls_banned = utils.gen_matches_any(
     'avatar', '\.gif', '\.ico', 'logo', 'ads')
@@ -0,0 +1,120 @@
+"""
+
+    extracty.singleflight -- coalescing of concurrent identical work
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import sys
+import time
+import errno
+import fcntl
+import hashlib
+import threading
+import contextlib
+
+__all__ = ('SingleFlight', 'KeyLocks')
+
+class _Call(object):
+
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+class SingleFlight(object):
+    """ Coalesce concurrent calls for the same key within a process
+
+    The first thread to call :meth:`do` for a key runs the function, threads
+    which call it for the same key meanwhile wait and get the same result, or
+    the same exception raised.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """ Return ``func(*args, **kwargs)``, computed once for concurrent
+        calls with the same ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+class KeyLocks(object):
+    """ Per key locks shared between processes on the same host
+
+    Locks are ``flock`` locks of files in ``path``, keys are hashed into a
+    fixed number of files, so the directory doesn't grow, at the price of
+    rare collisions of unrelated keys. A lock which isn't acquired within
+    ``timeout`` seconds is treated as a lease which expired and the caller
+    proceeds without it, so a stuck process doesn't block others forever.
+
+    :param path:
+        directory for lock files, created if missing
+    :param timeout:
+        maximum time in seconds to wait for a lock
+    :param buckets:
+        number of lock files
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, path, timeout=30, buckets=1024):
+        self.path = path
+        self.timeout = timeout
+        self.buckets = buckets
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _filename(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf8')
+        bucket = int(hashlib.sha1(key).hexdigest()[:8], 16) % self.buckets
+        return os.path.join(self.path, '%04d.lock' % bucket)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """ Hold lock for ``key`` within the block, yield if it was acquired"""
+        fd = os.open(self._filename(key), os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            acquired = False
+            deadline = time.time() + self.timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except IOError, e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                if time.time() >= deadline:
+                    break
+                time.sleep(self.poll_interval)
+            yield acquired
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
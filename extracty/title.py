@@ -5,33 +5,34 @@
 
 """
 
-import lxml.html
+import lxml.etree
+
 from . import utils
+from .context import as_context
 
 def extract_title(doc):
-    if isinstance(doc, basestring):
-        doc = lxml.html.fromstring(doc)
+    ctx = as_context(doc)
+    doc = ctx.doc
 
     def _find_meta_title(doc):
-        metas = doc.xpath('//meta[@name="title"]|//meta[@name="Title"]')
+        metas = ctx.meta.find('name', 'title', 'Title')
         for meta in metas:
             return meta.attrib.get('content')
 
     def _find_og_meta_title(doc):
-        metas = doc.xpath('//meta[@property="og:title"]')
+        metas = ctx.meta.find('property', 'og:title')
         for meta in metas:
             return meta.attrib.get('content')
 
     def _find_title(doc):
-        titles = doc.xpath('//title')
+        titles = _title_xpath(doc)
         for title in titles:
             text = utils.html_to_text(title)
             if text:
                 return text
 
     def _headers(doc):
-        # not sure if need to look for h4, h5, h6, ...
-        return doc.xpath('//h1|//h2|//h3')
+        return _headers_xpath(doc)
 
     def _clean(title, doc):
         found = [] # (text, header level)
@@ -48,3 +49,8 @@ def extract_title(doc):
         title = finder(doc)
         if title:
             return _clean(title, doc)
+
+_title_xpath = lxml.etree.XPath('//title')
+
+# not sure if need to look for h4, h5, h6, ...
+_headers_xpath = lxml.etree.XPath('//h1|//h2|//h3')
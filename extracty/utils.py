@@ -6,9 +6,13 @@
 """
 
 import re
+import codecs
+import lxml.etree
 import lxml.html
-import urllib2
 import dateutil.parser
+import justext
+
+from .fetch import default_fetcher
 
 def gen_matches_any(*p):
     """ Generate regexp for matching against any of the parts ``p``"""
@@ -21,14 +25,79 @@ def matches_attr(p, e, *attrs):
             return True
     return False
 
+_text_xpath = lxml.etree.XPath('.//text()')
+
 def html_to_text(doc):
     """ HTML to text converter"""
     if isinstance(doc, basestring):
         doc = lxml.html.fromstring(doc)
 
-    txt = doc.xpath('.//text()')
+    txt = _text_xpath(doc)
     txt = ' '.join(txt)
-    return re.sub('\s+', ' ', txt).strip()
+    return _ws_re.sub(' ', txt).strip()
+
+def text_stats(doc):
+    """ Collect text and image facts for each element of ``doc`` in one pass
+
+    Returns a dict which maps each element (comments and processing
+    instructions included) to a ``(text_length, has_text, has_image)`` tuple:
+
+    ``text_length``
+        length of subtree text with whitespace normalized in each text node
+        and text nodes joined by a single space; it is never greater than
+        ``len(html_to_text(el))`` and equals it unless text nodes start or
+        end with non-ASCII whitespace
+
+    ``has_text``
+        if ``html_to_text(el)`` is non-empty
+
+    ``has_image``
+        if element is an ``<img>`` or contains one
+    """
+    stats = {}
+    empty = (0, False, False)
+    for event, el in lxml.etree.iterwalk(
+            doc, events=('end', 'comment', 'pi')):
+        if event != 'end':
+            stats[el] = empty
+            continue
+        length = 0
+        parts = 0
+        has_image = el.tag == 'img'
+        if el.text:
+            part = _text_length(el.text)
+            if part:
+                length += part
+                parts += 1
+        for child in el:
+            child_length, child_has_text, child_has_image = stats.get(
+                child, empty)
+            if child_has_text:
+                length += child_length
+                parts += 1
+            has_image = has_image or child_has_image
+            if child.tail:
+                part = _text_length(child.tail)
+                if part:
+                    length += part
+                    parts += 1
+        if parts:
+            stats[el] = (length + parts - 1, True, has_image)
+        else:
+            stats[el] = (0, False, has_image)
+    return stats
+
+def _text_length(text):
+    """ Length of a text node with whitespace normalized"""
+    if type(text) is str:
+        # ASCII only text, split() breaks on the same characters as \s
+        words = text.split()
+        return len(words) + sum(len(w) for w in words) - 1 if words else 0
+    if not text.strip():
+        return 0
+    return len(_ws_re.sub(' ', text).strip())
+
+_ws_re = re.compile(r'\s+')
 
 def precedings(element, before=None, skip=None):
     """ Traverse tree from element in preceding order
@@ -47,26 +116,32 @@ def precedings(element, before=None, skip=None):
 
     skip = skip or (lambda x: False)
 
-    def _rev_children(element):
-        for e in element.iterchildren(reversed=True):
-            if skip(e):
+    def _rev_subtree(element):
+        # element's descendants in reverse document order followed by the
+        # element itself, iteratively, so deep trees don't nest generators
+        stack = [(element, False)]
+        while stack:
+            (e, expanded) = stack.pop()
+            if expanded:
+                yield e
                 continue
-            for se in _rev_children(e):
-                yield se
-            yield e
+            stack.append((e, True))
+            for ch in e.iterchildren():
+                if not skip(ch):
+                    stack.append((ch, False))
 
     def _precedings(element):
-        for sib in element.itersiblings(preceding=True):
-            if skip(sib):
-                continue
-            for ch in _rev_children(sib):
-                yield ch
-            yield sib
-
-        if element.getparent() is not None and not skip(element.getparent()):
-            yield element.getparent()
-            for el in _precedings(element.getparent()):
-                yield el
+        while True:
+            for sib in element.itersiblings(preceding=True):
+                if skip(sib):
+                    continue
+                for e in _rev_subtree(sib):
+                    yield e
+            parent = element.getparent()
+            if parent is None or skip(parent):
+                return
+            yield parent
+            element = parent
 
     for x in _precedings(element):
         if before and before(x):
@@ -75,11 +150,13 @@ def precedings(element, before=None, skip=None):
 
 def depth_first(element, skip=None):
     """ Traverse tree in depth-first manner"""
-    if not (skip and skip(element)):
-        yield element
-        for ch in element.iterchildren():
-            for el in depth_first(ch, skip=skip):
-                yield el
+    stack = [element]
+    while stack:
+        e = stack.pop()
+        if skip and skip(e):
+            continue
+        yield e
+        stack.extend(e.iterchildren(reversed=True))
 
 def try_parse_timestamp(v):
     try:
@@ -91,12 +168,75 @@ _zn2_re = re.compile(r'[^a-z0-9]', re.I)
 def zn2(v):
     return _zn2_re.sub('', v)
 
-def fetch_url(url):
-    request = urllib2.Request(url, headers={
-        'User-Agent': (
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8)'
-            ' AppleWebKit/536.25 (KHTML, like Gecko)'
-            ' Version/6.0 Safari/536.25')
+def open_url(url, fetcher=None, max_size=None):
+    """ Open ``url`` for reading with ``fetcher``, the shared one by default"""
+    fetcher = fetcher or default_fetcher()
+    return fetcher.open(url, max_size=max_size)
+
+def fetch_url(url, fetcher=None, max_size=None):
+    """ Fetch ``url``, return response body"""
+    fetcher = fetcher or default_fetcher()
+    return fetcher.fetch(url, max_size=max_size)
+
+def parse_html(data, charset=None):
+    """ Parse HTML document ``data``
+
+    Byte strings are decoded once before parsing, with ``charset`` if it is
+    provided and known, otherwise with the encoding declared in ``<meta>``
+    near the start of the document, UTF-8 being the default.
 
-    })
-    return urllib2.urlopen(request).read()
+    :param charset:
+        charset of ``data``, e.g. from ``Content-Type`` header
+    """
+    if isinstance(data, unicode):
+        return lxml.html.fromstring(data)
+    if charset:
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            charset = None
+    return justext.parse_html(data, encoding=charset)
+
+def parse_stream(fp, head_only=False, chunk_size=16 * 1024, charset=None):
+    """ Parse HTML from file-like ``fp``
+
+    Returns ``(doc, data, complete)`` triple, where ``data`` is what was read
+    from ``fp`` and ``complete`` tells if ``fp`` was read till the end.
+
+    :param head_only:
+        stop reading as soon as ``<head>`` is complete, the rest of document
+        is left unread in ``fp``
+    :param chunk_size:
+        size of chunks to read from ``fp``
+    :param charset:
+        charset of data, see :func:`parse_html`
+    """
+    if not head_only:
+        data = fp.read()
+        return parse_html(data, charset), data, True
+
+    # chunks are fed into incremental parser only to find out where <head>
+    # ends, the tree is built from the data read so far by the regular parser,
+    # because incremental parser doesn't decode entities split between chunks
+    parser = lxml.etree.HTMLPullParser(
+        events=('start', 'end'), tag=('head', 'body'))
+    chunks = []
+    complete = True
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        parser.feed(chunk)
+        if any(
+                event == 'end' or el.tag == 'body'
+                for (event, el) in parser.read_events()):
+            complete = False
+            break
+    data = ''.join(chunks)
+    doc = parse_html(data, charset)
+    if not complete:
+        # leave no partially read body in the tree
+        for body in doc.findall('body'):
+            doc.remove(body)
+    return doc, data, complete
@@ -4,7 +4,8 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
-from justext.core import justext, get_stoplists, get_stoplist, main
+from justext.core import justext, get_stoplists, get_stoplist, main, \
+    preload_stoplists, stoplist_registry, decode_html, parse_html
 
 try:
     __version__ = __import__('pkg_resources').get_distribution('justext').version
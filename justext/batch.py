@@ -0,0 +1,176 @@
+# Copyright (c) 2011 Jan Pomikalek
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution.
+
+"""
+Context-free classification of paragraphs of many documents at once.
+
+Paragraphs are described by columns -- equally long NumPy arrays with one
+entry per paragraph of all documents concatenated, doc_offsets tells where
+paragraphs of each document start. Densities and context-free classes are
+computed with vectorized operations, which pays off when reprocessing large
+numbers of pages offline. Requires NumPy.
+"""
+
+import re
+
+import numpy
+
+from justext.core import LENGTH_LOW_DEFAULT, LENGTH_HIGH_DEFAULT, \
+    STOPWORDS_LOW_DEFAULT, STOPWORDS_HIGH_DEFAULT, MAX_LINK_DENSITY_DEFAULT, \
+    NO_HEADINGS_DEFAULT
+
+# context-free classes, codes are indices in this tuple
+CLASSES = ('bad', 'short', 'neargood', 'good')
+BAD, SHORT, NEARGOOD, GOOD = range(len(CLASSES))
+
+_heading_re = re.compile('(^h\d|\.h\d)')
+_select_re = re.compile('(^select|\.select)')
+
+def paragraph_columns(documents, stoplist, no_headings=NO_HEADINGS_DEFAULT):
+    """
+    Converts paragraphs of documents (as returned by make_paragraphs, one list
+    per document) into columns:
+
+    length, word_count, stopword_count, linked_char_count:
+      Integer arrays.
+
+    heading, select, copyright:
+      Boolean arrays, set if the paragraph is a heading, is inside <select> or
+      contains a copyright sign respectively.
+
+    doc_offsets:
+      Integer array of len(documents) + 1 items, paragraphs of i-th document
+      are at doc_offsets[i]:doc_offsets[i + 1].
+    """
+    length = []
+    word_count = []
+    stopword_count = []
+    linked_char_count = []
+    heading = []
+    select = []
+    copyright = []
+    doc_offsets = [0]
+    for paragraphs in documents:
+        for paragraph in paragraphs:
+            text = paragraph['text']
+            dom_path = paragraph['dom_path']
+            length.append(len(text))
+            word_count.append(paragraph['word_count'])
+            stopword_count.append(
+                sum(1 for word in text.split() if word in stoplist))
+            linked_char_count.append(paragraph['linked_char_count'])
+            heading.append(
+                not no_headings and _heading_re.search(dom_path) is not None)
+            select.append(_select_re.search(dom_path) is not None)
+            copyright.append((u'\xa9' in text) or ('&copy' in text))
+        doc_offsets.append(len(length))
+    return {
+        'length': numpy.array(length, dtype=numpy.int64),
+        'word_count': numpy.array(word_count, dtype=numpy.int64),
+        'stopword_count': numpy.array(stopword_count, dtype=numpy.int64),
+        'linked_char_count': numpy.array(linked_char_count, dtype=numpy.int64),
+        'heading': numpy.array(heading, dtype=bool),
+        'select': numpy.array(select, dtype=bool),
+        'copyright': numpy.array(copyright, dtype=bool),
+        'doc_offsets': numpy.array(doc_offsets, dtype=numpy.int64),
+    }
+
+def densities(columns):
+    """
+    Returns (stopword_density, link_density) float arrays, both are 0 for
+    paragraphs without words.
+    """
+    word_count = columns['word_count']
+    has_words = word_count > 0
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        stopword_density = numpy.where(has_words,
+            1.0 * columns['stopword_count'] / word_count, 0.0)
+        link_density = numpy.where(has_words,
+            1.0 * columns['linked_char_count'] / columns['length'], 0.0)
+    return stopword_density, link_density
+
+def classify_columns(columns, length_low=LENGTH_LOW_DEFAULT,
+        length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
+        stopwords_high=STOPWORDS_HIGH_DEFAULT,
+        max_link_density=MAX_LINK_DENSITY_DEFAULT):
+    """
+    Context-free classification of all paragraphs in columns, gives the same
+    classes as classify_paragraphs. Returns (cfclass, stopword_density,
+    link_density) arrays, cfclass holds codes of CLASSES.
+    """
+    length = columns['length']
+    stopword_density, link_density = densities(columns)
+    # conditions are checked in the same order as in classify_paragraphs,
+    # the first one which holds wins
+    cfclass = numpy.select([
+            link_density > max_link_density,
+            columns['copyright'],
+            columns['select'],
+            (length < length_low) & (columns['linked_char_count'] > 0),
+            length < length_low,
+            (stopword_density >= stopwords_high) & (length > length_high),
+            stopword_density >= stopwords_high,
+            stopword_density >= stopwords_low,
+        ], [
+            BAD,
+            BAD,
+            BAD,
+            BAD,
+            SHORT,
+            GOOD,
+            NEARGOOD,
+            NEARGOOD,
+        ], default=BAD).astype(numpy.int8)
+    return cfclass, stopword_density, link_density
+
+def split_documents(array, doc_offsets):
+    "Splits a column into a list of per-document arrays (views)."
+    return [array[start:end]
+        for start, end in zip(doc_offsets[:-1], doc_offsets[1:])]
+
+def classify_batch(columns, length_low=LENGTH_LOW_DEFAULT,
+        length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
+        stopwords_high=STOPWORDS_HIGH_DEFAULT,
+        max_link_density=MAX_LINK_DENSITY_DEFAULT):
+    "Returns a list of per-document arrays of context-free class codes."
+    cfclass, _, _ = classify_columns(columns, length_low, length_high,
+        stopwords_low, stopwords_high, max_link_density)
+    return split_documents(cfclass, columns['doc_offsets'])
+
+def classify_documents(documents, stoplist, length_low=LENGTH_LOW_DEFAULT,
+        length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
+        stopwords_high=STOPWORDS_HIGH_DEFAULT,
+        max_link_density=MAX_LINK_DENSITY_DEFAULT,
+        no_headings=NO_HEADINGS_DEFAULT):
+    """
+    Batch counterpart of classify_paragraphs: classifies paragraphs of all
+    documents at once and stores the results into the paragraphs the same
+    way, so revise_paragraph_classification can be applied to each document
+    afterwards.
+    """
+    columns = paragraph_columns(documents, stoplist, no_headings)
+    cfclass, stopword_density, link_density = classify_columns(columns,
+        length_low, length_high, stopwords_low, stopwords_high,
+        max_link_density)
+    stopword_count = columns['stopword_count'].tolist()
+    heading = columns['heading'].tolist()
+    cfclass = cfclass.tolist()
+    stopword_density = stopword_density.tolist()
+    link_density = link_density.tolist()
+    word_count = columns['word_count'].tolist()
+    i = 0
+    for paragraphs in documents:
+        for paragraph in paragraphs:
+            paragraph['stopword_count'] = stopword_count[i]
+            if word_count[i] == 0:
+                paragraph['stopword_density'] = 0
+                paragraph['link_density'] = 0
+            else:
+                paragraph['stopword_density'] = stopword_density[i]
+                paragraph['link_density'] = link_density[i]
+            paragraph['heading'] = heading[i]
+            paragraph['cfclass'] = CLASSES[cfclass[i]]
+            i += 1
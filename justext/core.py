@@ -6,15 +6,14 @@
 
 import codecs
 import os
+from array import array
 import pkgutil
 import re
 import sys
-
-from xml.sax.handler import ContentHandler
+import threading
 
 import lxml.etree
 import lxml.html
-import lxml.sax
 
 MAX_LINK_DENSITY_DEFAULT = 0.2
 LENGTH_LOW_DEFAULT = 70
@@ -29,6 +28,7 @@ PARAGRAPH_TAGS = ['blockquote', 'caption', 'center', 'col', 'colgroup', 'dd',
         'div', 'dl', 'dt', 'fieldset', 'form', 'legend', 'optgroup', 'option',
         'p', 'pre', 'table', 'td', 'textarea', 'tfoot', 'th', 'thead', 'tr',
         'ul', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+PARAGRAPH_TAG_SET = frozenset(PARAGRAPH_TAGS)
 DEFAULT_ENCODING = 'utf-8'
 DEFAULT_ENC_ERRORS = 'replace'
 
@@ -38,21 +38,108 @@ class JustextError(Exception):
 class JustextInvalidOptions(JustextError):
     pass
 
+class StoplistRegistry(object):
+    """
+    Process-wide registry of inbuilt stoplists. Each stoplist is read from the
+    package data once and kept as a frozenset, so the same object can be
+    shared between threads and requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stoplists = {}
+        self._languages = None
+
+    def languages(self):
+        "Returns a list of inbuilt stoplists."
+        if self._languages is None:
+            with self._lock:
+                if self._languages is None:
+                    stoplists_dir = os.path.join(
+                        os.path.dirname(sys.modules['justext'].__file__),
+                        'stoplists')
+                    self._languages = tuple(
+                        filename.rsplit('.', 1)[0]
+                        for filename in os.listdir(stoplists_dir)
+                        if filename.endswith('.txt'))
+        return list(self._languages)
+
+    def get(self, language):
+        "Returns an inbuilt stoplist for the language as a frozenset of words."
+        stoplist = self._stoplists.get(language)
+        if stoplist is None:
+            with self._lock:
+                stoplist = self._stoplists.get(language)
+                if stoplist is None:
+                    stoplist = self._load(language)
+                    self._stoplists[language] = stoplist
+        return stoplist
+
+    def preload(self, languages=None):
+        """
+        Loads stoplists for the languages (all inbuilt stoplists if None), so
+        no request pays for reading them later.
+        """
+        if languages is None:
+            languages = self.languages()
+        for language in languages:
+            self.get(language)
+
+    def loaded(self):
+        "Returns a list of already loaded stoplists."
+        return self._stoplists.keys()
+
+    def memory_usage(self):
+        "Returns approximate number of bytes taken by loaded stoplists."
+        size = 0
+        for stoplist in self._stoplists.values():
+            size += sys.getsizeof(stoplist)
+            size += sum(sys.getsizeof(word) for word in stoplist)
+        return size
+
+    def _load(self, language):
+        stoplist_contents = pkgutil.get_data('justext',
+            os.path.join('stoplists', language + '.txt'))
+        return frozenset(
+            unicode(l.strip(), 'utf-8') for l in stoplist_contents.split('\n'))
+
+stoplist_registry = StoplistRegistry()
+
 def get_stoplists():
     "Returns a list of inbuilt stoplists."
-    stoplists = []
-    stoplists_dir = os.path.join(
-        os.path.dirname(sys.modules['justext'].__file__), 'stoplists')
-    for filename in os.listdir(stoplists_dir):
-        if filename.endswith('.txt'):
-            stoplists.append(filename.rsplit('.', 1)[0])
-    return stoplists
+    return stoplist_registry.languages()
 
 def get_stoplist(language):
-    "Returns an inbuilt stoplist for the language as a set of words."
-    stoplist_contents = pkgutil.get_data('justext',
-        os.path.join('stoplists', language + '.txt'))
-    return set([unicode(l.strip(), 'utf-8') for l in stoplist_contents.split('\n')])
+    "Returns an inbuilt stoplist for the language as a frozenset of words."
+    return stoplist_registry.get(language)
+
+def preload_stoplists(languages=None):
+    "Loads inbuilt stoplists for the languages (all if None) upfront."
+    stoplist_registry.preload(languages)
+
+# encoding declarations in <meta> are looked for only in this many first
+# bytes of a page
+SNIFF_SIZE = 8192
+
+# patterns of encoding declarations in <meta>, in order of precedence
+_meta_encoding_res = [re.compile(pattern, re.I) for pattern in (
+    r'''<meta\s+http-equiv=['"]?content-type['"]?\s+content=['"]?[^'"]*charset=([^'"]+)''',
+    r'''<meta\s+content=['"]?[^'"]*charset=([^'"]+)['"]?\s+http-equiv=['"]?content-type['"]?''',
+    r'''<meta\s+http-equiv=['"]?charset['"]?\s+content=['"]?([^'"]+)''',
+    r'''<meta\s+content=['"]?([^'"]+)['"]?\s+http-equiv=['"]?charset['"]?''',
+    r'''<meta\s+charset=['"]?([^'"]+)''',
+    )]
+
+def sniff_encodings(html_string):
+    """
+    Yields encodings declared in <meta> tags within the first SNIFF_SIZE
+    bytes of html_string, in order of precedence.
+    """
+    head = html_string[:SNIFF_SIZE]
+    for re_meta in _meta_encoding_res:
+        m = re_meta.search(head)
+        if m:
+            yield m.group(1)
 
 def decode_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
         errors=DEFAULT_ENC_ERRORS):
@@ -62,21 +149,16 @@ def decode_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
     """
     if encoding:
         return unicode(html_string, encoding, errors=errors)
-    re_meta1 = re.compile('''<meta\s+http-equiv=['"]?content-type['"]?\s+content=['"]?[^'"]*charset=([^'"]+)''', re.I)
-    re_meta2 = re.compile('''<meta\s+content=['"]?[^'"]*charset=([^'"]+)['"]?\s+http-equiv=['"]?content-type['"]?''', re.I)
-    re_meta3 = re.compile('''<meta\s+http-equiv=['"]?charset['"]?\s+content=['"]?([^'"]+)''', re.I)
-    re_meta4 = re.compile('''<meta\s+content=['"]?([^'"]+)['"]?\s+http-equiv=['"]?charset['"]?''', re.I)
-    re_meta5 = re.compile('''<meta\s+charset=['"]?([^'"]+)''', re.I)
-    for re_meta in (re_meta1, re_meta2, re_meta3, re_meta4, re_meta5):
-        m = re_meta.search(html_string)
-        if m:
-            meta_encoding = m.group(1)
-            try:
-                return unicode(html_string, meta_encoding, errors=errors)
-            except LookupError:
-                # if the encoding specified in <meta> is unknown
-                # proceed as if it wasn't found at all
-                pass
+    for meta_encoding in sniff_encodings(html_string):
+        try:
+            return unicode(html_string, meta_encoding, errors=errors)
+        except LookupError:
+            # if the encoding specified in <meta> is unknown
+            # proceed as if it wasn't found at all
+            pass
+    if codecs.lookup(default_encoding).name == 'utf-8':
+        # trying strict utf-8 first would give the same result
+        return unicode(html_string, 'utf-8', errors=errors)
     try:
         # if unknown encoding, try utf-8 first
         return unicode(html_string, 'utf-8', errors='strict')
@@ -157,63 +239,207 @@ def preprocess(root):
         node.drop_tree()
     return root
 
-class XPathPart(object):
+def element_xpath(element):
+    """
+    Returns an XPath expression which points to the element, with a position
+    predicate for each step, e.g. /html[1]/body[1]/div[2].
+    """
+    parts = []
+    while element is not None:
+        idx = 1
+        for dummy_sibling in element.itersiblings(element.tag, preceding=True):
+            idx += 1
+        parts.append('%s[%d]' % (element.tag, idx))
+        element = element.getparent()
+    parts.reverse()
+    return '/' + '/'.join(parts)
+
+class TextBuffer(object):
+    """
+    Text of all paragraphs of a document kept in a single string. Text nodes
+    are appended while paragraphs are made, text nodes of a paragraph are
+    separated by a space, so the text of a paragraph is a slice of the buffer.
+    """
+
+    __slots__ = ('_parts', '_text', '_length', 'node_starts', 'node_ends')
 
-    def __init__(self, name, idx):
-        self.name = name
-        self.idx = idx
-        self.children = {}
+    def __init__(self):
+        self._parts = []
+        self._text = None
+        self._length = 0
+        self.node_starts = array('l')
+        self.node_ends = array('l')
+
+    def __len__(self):
+        return len(self.node_starts)
+
+    def append(self, node, separate=False):
+        "Appends a text node, preceded by a space if separate is True."
+        if separate:
+            self._parts.append(' ')
+            self._length += 1
+        self._parts.append(node)
+        self.node_starts.append(self._length)
+        self._length += len(node)
+        self.node_ends.append(self._length)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = ''.join(self._parts)
+            self._parts = None
+        return self._text
+
+class Paragraph(object):
+    """
+    A compact paragraph record. Text is kept in the TextBuffer shared by all
+    paragraphs of the document, only the range of text nodes is stored.
 
-    def next(self, name):
-        if name in self.children:
-            idx = self.children[name] + 1
-        else:
-            idx = 1
-        self.children[name] = idx
-        return XPathPart(name, idx)
+    Attributes can be accessed as keys for compatibility with paragraphs
+    represented as dictionaries, e.g. paragraph['class'] is paragraph.class_.
+    The xpath key is computed from element on the first access.
+    """
+
+    __slots__ = ('_buffer', '_first_node', '_end_node', '_xpath', 'dom_path',
+        'element', 'word_count', 'linked_char_count', 'tag_count',
+        'stopword_count', 'stopword_density', 'link_density', 'heading',
+        'cfclass', 'class_')
+
+    KEYS = ('text', 'text_nodes', 'xpath', 'dom_path', 'element',
+        'word_count', 'linked_char_count', 'tag_count', 'stopword_count',
+        'stopword_density', 'link_density', 'heading', 'cfclass', 'class')
+
+    def __init__(self, buffer, dom_path, element):
+        self._buffer = buffer
+        self._first_node = self._end_node = len(buffer)
+        self._xpath = None
+        self.dom_path = dom_path
+        self.element = element
+        self.word_count = 0
+        self.linked_char_count = 0
+        self.tag_count = 0
+
+    def append_text_node(self, node):
+        self._buffer.append(node, separate=self._end_node > self._first_node)
+        self._end_node += 1
+
+    @property
+    def text(self):
+        if self._end_node == self._first_node:
+            return u''
+        buffer = self._buffer
+        return buffer.text[buffer.node_starts[self._first_node]:
+            buffer.node_ends[self._end_node - 1]]
+
+    @property
+    def text_nodes(self):
+        buffer = self._buffer
+        text = buffer.text
+        return [text[buffer.node_starts[i]:buffer.node_ends[i]]
+            for i in xrange(self._first_node, self._end_node)]
+
+    @property
+    def xpath(self):
+        if self._xpath is None:
+            self._xpath = element_xpath(self.element)
+        return self._xpath
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, _paragraph_attrs[key])
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in ('text', 'text_nodes', 'xpath'):
+            raise KeyError('%s is computed and cannot be set' % key)
+        setattr(self, _paragraph_attrs[key], value)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in self.KEYS if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
 
-class SaxPragraphMaker(ContentHandler):
+    def __repr__(self):
+        return '<Paragraph %r>' % dict(self.items())
+
+# maps keys of paragraphs to attributes of Paragraph
+_paragraph_attrs = dict((key, key) for key in Paragraph.KEYS)
+_paragraph_attrs['class'] = 'class_'
+
+class ParagraphMaker(object):
     """
     A class for converting a HTML page represented as a DOM object into a list
-    of paragraphs.
+    of paragraphs. Walks the tree directly, text and tail of each element are
+    handled in document order.
     """
 
     def __init__(self):
         self.dom = []
-        self.xpath = []
+        self.elements = []
+        self.buffer = TextBuffer()
         self.paragraphs = []
-        self.paragraph = {}
+        self.paragraph = None
         self.link = False
         self.br = False
         self._start_new_pragraph()
 
+    def make(self, root):
+        "Walks the tree under root and returns the list of paragraphs."
+        if hasattr(root, 'getroot'):
+            root = root.getroot()
+        start, end = self.start, self.end
+        characters = self.characters
+        for event, element in lxml.etree.iterwalk(
+                root, events=('start', 'end', 'comment', 'pi')):
+            if event == 'start':
+                start(element)
+                if element.text:
+                    characters(element.text)
+            elif event == 'end':
+                end(element)
+                if element.tail:
+                    characters(element.tail)
+            elif element.tail:
+                # comments and processing instructions contribute only tails
+                characters(element.tail)
+        self._start_new_pragraph()
+        return self.paragraphs
+
     def _start_new_pragraph(self):
-        if self.paragraph and self.paragraph['text_nodes'] != []:
-            self.paragraph['text'] = ' '.join(self.paragraph['text_nodes'])
-            self.paragraphs.append(self.paragraph)
-        self.paragraph = {
-            'dom_path': '.'.join(self.dom),
-            'xpath': '/' + '/'.join(
-                '%s[%d]' % (x.name, x.idx) for x in self.xpath),
-            'text_nodes': [],
-            'word_count': 0,
-            'linked_char_count': 0,
-            'tag_count': 0,
-        }
-
-    def startElementNS(self, name, qname, attrs):
-        dummy_uri, name = name
+        paragraph = self.paragraph
+        if paragraph and paragraph._end_node > paragraph._first_node:
+            self.paragraphs.append(paragraph)
+        self.paragraph = Paragraph(self.buffer, '.'.join(self.dom),
+            self.elements[-1] if self.elements else None)
+
+    def start(self, element):
+        name = _local_name(element.tag)
         self.dom.append(name)
-        if self.xpath:
-            self.xpath.append(self.xpath[-1].next(name))
-        else:
-            self.xpath.append(XPathPart(name, 1))
-        if name in PARAGRAPH_TAGS or (name == 'br' and self.br):
+        self.elements.append(element)
+        if name in PARAGRAPH_TAG_SET or (name == 'br' and self.br):
             if name == 'br':
                 # the <br><br> is a paragraph separator and should
                 # not be included in the number of tags within the
                 # paragraph
-                self.paragraph['tag_count'] -= 1
+                self.paragraph.tag_count -= 1
             self._start_new_pragraph()
         else:
             if name == 'br':
@@ -222,36 +448,51 @@ class SaxPragraphMaker(ContentHandler):
                 self.br = False
             if name == 'a':
                 self.link = True
-            self.paragraph['tag_count'] += 1
+            self.paragraph.tag_count += 1
 
-    def endElementNS(self, name, qname):
-        dummy_uri, name = name
-        self.dom.pop()
-        self.xpath.pop()
-        if name in PARAGRAPH_TAGS:
+    def end(self, element):
+        name = self.dom.pop()
+        self.elements.pop()
+        if name in PARAGRAPH_TAG_SET:
             self._start_new_pragraph()
         if name == 'a':
             self.link = False
 
-    def endDocument(self):
-        self._start_new_pragraph()
-
     def characters(self, content):
-        if content.strip() == '':
-            return
-        text = re.sub("\s+", " ", content)
-        self.paragraph['text_nodes'].append(text.strip())
-        words = text.strip().split()
-        self.paragraph['word_count'] += len(words)
+        if type(content) is str:
+            # lxml gives ASCII-only text as str, for which split() breaks on
+            # the same characters as \s, so no regular expression is needed
+            words = content.split()
+            if not words:
+                return
+            stripped = ' '.join(words)
+            text_length = (len(stripped)
+                + content[0].isspace() + content[-1].isspace())
+        else:
+            if not content.strip():
+                return
+            text = _whitespace_re.sub(" ", content)
+            stripped = text.strip()
+            words = stripped.split()
+            text_length = len(text)
+        paragraph = self.paragraph
+        paragraph.append_text_node(stripped)
+        paragraph.word_count += len(words)
         if self.link:
-            self.paragraph['linked_char_count'] += len(text)
+            paragraph.linked_char_count += text_length
         self.br = False
 
+_whitespace_re = re.compile("\s+")
+
+def _local_name(tag):
+    "Strips namespace from the tag name."
+    if tag[0] == '{':
+        return tag.split('}', 1)[1]
+    return tag
+
 def make_paragraphs(root):
     "Converts DOM into paragraphs."
-    handler = SaxPragraphMaker()
-    lxml.sax.saxify(root, handler)
-    return handler.paragraphs
+    return ParagraphMaker().make(root)
 
 def classify_paragraphs(paragraphs, stoplist, length_low=LENGTH_LOW_DEFAULT,
         length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
@@ -259,9 +500,10 @@ def classify_paragraphs(paragraphs, stoplist, length_low=LENGTH_LOW_DEFAULT,
         no_headings=NO_HEADINGS_DEFAULT):
     "Context-free paragraph classification."
     for paragraph in paragraphs:
-        length = len(paragraph['text'])
+        text = paragraph['text']
+        length = len(text)
         stopword_count = 0
-        for word in paragraph['text'].split():
+        for word in text.split():
             if word in stoplist:
                 stopword_count += 1
         word_count = paragraph['word_count']
@@ -278,7 +520,7 @@ def classify_paragraphs(paragraphs, stoplist, length_low=LENGTH_LOW_DEFAULT,
         paragraph['heading'] = bool(not no_headings and re.search('(^h\d|\.h\d)', paragraph['dom_path']))
         if link_density > max_link_density:
             paragraph['cfclass'] = 'bad'
-        elif (u'\xa9' in paragraph['text']) or ('&copy' in paragraph['text']):
+        elif (u'\xa9' in text) or ('&copy' in text):
             paragraph['cfclass'] = 'bad'
         elif re.search('(^select|\.select)', paragraph['dom_path']):
             paragraph['cfclass'] = 'bad'
@@ -325,73 +567,111 @@ def get_next_neighbour(i, paragraphs, ignore_neargood):
     """
     return _get_neighbour(i, paragraphs, ignore_neargood, 1, len(paragraphs))
 
+def _neighbours(classes, ignore_neargood, reverse=False):
+    """
+    Returns a list with the class of the nearest neighbour of each paragraph
+    on the top end (or the bottom end if reverse is True) in one sweep, the
+    same as get_prev_neighbour (get_next_neighbour) returns for each index.
+    """
+    neighbours = [None] * len(classes)
+    indices = xrange(len(classes))
+    if reverse:
+        indices = reversed(indices)
+    neighbour = 'bad'
+    for i in indices:
+        neighbours[i] = neighbour
+        c = classes[i]
+        if c == 'good' or c == 'bad' or (c == 'neargood' and not ignore_neargood):
+            neighbour = c
+    return neighbours
+
+def _next_good(classes):
+    "Returns a list with the index of the next good paragraph or None."
+    next_good = [None] * len(classes)
+    j = None
+    for i in xrange(len(classes) - 1, -1, -1):
+        next_good[i] = j
+        if classes[i] == 'good':
+            j = i
+    return next_good
+
 def revise_paragraph_classification(paragraphs, max_heading_distance=MAX_HEADING_DISTANCE_DEFAULT):
     """
     Context-sensitive paragraph classification. Assumes that classify_pragraphs
     has already been called.
+
+    Neighbours and distances are precomputed with linear sweeps, so the result
+    is the same as of scanning from each paragraph, in O(n).
     """
     # copy classes
+    classes = [paragraph['cfclass'] for paragraph in paragraphs]
+
+    # offsets[i] is the length of all paragraphs' text before i-th paragraph
+    offsets = [0]
     for paragraph in paragraphs:
-        paragraph['class'] = paragraph['cfclass']
+        offsets.append(offsets[-1] + len(paragraph['text']))
+
+    def _heading_near_good(i, next_good):
+        j = next_good[i]
+        return j is not None and offsets[j] - offsets[i + 1] <= max_heading_distance
 
     # good headings
+    next_good = _next_good(classes)
     for i, paragraph in enumerate(paragraphs):
-        if not (paragraph['heading'] and paragraph['class'] == 'short'):
+        if not (paragraph['heading'] and classes[i] == 'short'):
             continue
-        j = i + 1
-        distance = 0
-        while j < len(paragraphs) and distance <= max_heading_distance:
-            if paragraphs[j]['class'] == 'good':
-                paragraph['class'] = 'neargood'
-                break
-            distance += len(paragraphs[j]['text'])
-            j += 1
+        if _heading_near_good(i, next_good):
+            classes[i] = 'neargood'
 
     # classify short
+    prev_neighbours = _neighbours(classes, ignore_neargood=True)
+    next_neighbours = _neighbours(classes, ignore_neargood=True, reverse=True)
+    prev_neighbours_ng = _neighbours(classes, ignore_neargood=False)
+    next_neighbours_ng = _neighbours(classes, ignore_neargood=False, reverse=True)
     new_classes = {}
-    for i, paragraph in enumerate(paragraphs):
-        if paragraph['class'] != 'short':
+    for i, c in enumerate(classes):
+        if c != 'short':
             continue
-        prev_neighbour = get_prev_neighbour(i, paragraphs, ignore_neargood=True)
-        next_neighbour = get_next_neighbour(i, paragraphs, ignore_neargood=True)
+        prev_neighbour = prev_neighbours[i]
+        next_neighbour = next_neighbours[i]
         neighbours = set((prev_neighbour, next_neighbour))
         if neighbours == set(['good']):
             new_classes[i] = 'good'
         elif neighbours == set(['bad']):
             new_classes[i] = 'bad'
         # it must be set(['good', 'bad'])
-        elif (prev_neighbour == 'bad' and get_prev_neighbour(i, paragraphs, ignore_neargood=False) == 'neargood') or \
-             (next_neighbour == 'bad' and get_next_neighbour(i, paragraphs, ignore_neargood=False) == 'neargood'):
+        elif (prev_neighbour == 'bad' and prev_neighbours_ng[i] == 'neargood') or \
+             (next_neighbour == 'bad' and next_neighbours_ng[i] == 'neargood'):
             new_classes[i] = 'good'
         else:
             new_classes[i] = 'bad'
 
     for i, c in new_classes.iteritems():
-        paragraphs[i]['class'] = c
-
-    # revise neargood
-    for i, paragraph in enumerate(paragraphs):
-        if paragraph['class'] != 'neargood':
-            continue
-        prev_neighbour = get_prev_neighbour(i, paragraphs, ignore_neargood=True)
-        next_neighbour = get_next_neighbour(i, paragraphs, ignore_neargood=True)
-        if (prev_neighbour, next_neighbour) == ('bad', 'bad'):
-            paragraph['class'] = 'bad'
-        else:
-            paragraph['class'] = 'good'
+        classes[i] = c
+
+    # revise neargood, paragraphs above are already revised when we get to
+    # a paragraph, so its top neighbour is tracked while we go
+    next_neighbours = _neighbours(classes, ignore_neargood=True, reverse=True)
+    prev_neighbour = 'bad'
+    for i, c in enumerate(classes):
+        if c == 'neargood':
+            if (prev_neighbour, next_neighbours[i]) == ('bad', 'bad'):
+                classes[i] = 'bad'
+            else:
+                classes[i] = 'good'
+        if classes[i] in ('good', 'bad'):
+            prev_neighbour = classes[i]
 
     # more good headings
+    next_good = _next_good(classes)
     for i, paragraph in enumerate(paragraphs):
-        if not (paragraph['heading'] and paragraph['class'] == 'bad' and paragraph['cfclass'] != 'bad'):
+        if not (paragraph['heading'] and classes[i] == 'bad' and paragraph['cfclass'] != 'bad'):
             continue
-        j = i + 1
-        distance = 0
-        while j < len(paragraphs) and distance <= max_heading_distance:
-            if paragraphs[j]['class'] == 'good':
-                paragraph['class'] = 'good'
-                break
-            distance += len(paragraphs[j]['text'])
-            j += 1
+        if _heading_near_good(i, next_good):
+            classes[i] = 'good'
+
+    for paragraph, c in zip(paragraphs, classes):
+        paragraph['class'] = c
 
 def justext(html, stoplist, length_low=LENGTH_LOW_DEFAULT,
         length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
@@ -401,7 +681,8 @@ def justext(html, stoplist, length_low=LENGTH_LOW_DEFAULT,
         enc_errors=DEFAULT_ENC_ERRORS):
     """
     Converts an HTML page into a list of classified paragraphs. Each paragraph
-    is represented as a dictionary with the following attributes:
+    is represented as a Paragraph record, which can be accessed as a
+    dictionary with the following keys:
 
     text:
       Plain text content.
@@ -434,8 +715,12 @@ def justext(html, stoplist, length_low=LENGTH_LOW_DEFAULT,
     dom_path:
       A dom path to the paragraph in the originial HTML page.
 
+    element:
+      The element of the page the paragraph starts in.
+
     xpath:
-      A XPath expression which points to the paragraph.
+      A XPath expression which points to the paragraph, computed from element
+      when accessed.
     """
     if isinstance(html, basestring):
         html = parse_html(html, encoding=encoding,
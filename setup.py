@@ -18,6 +18,9 @@ setup(
         'docopt',
         'PIL',
     ],
+    extras_require={
+        'batch': ['numpy'],
+    },
     package_data={'justext': ['stoplists/*.txt']},
     test_suite='tests',
     entry_points="""
@@ -1,7 +1,41 @@
+import os
+import time
+import random
+import shutil
+import tempfile
 import unittest
+import threading
+from StringIO import StringIO
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
 import lxml.etree
+import lxml.html
 
-from extracty.utils import precedings, depth_first
+import justext
+from justext.core import StoplistRegistry, make_paragraphs, \
+    classify_paragraphs, revise_paragraph_classification, \
+    get_prev_neighbour, get_next_neighbour
+
+try:
+    from justext import batch
+except ImportError:
+    batch = None
+import extracty
+from extracty import extract, extract_url, extract_many, extract_urls, \
+    Context
+from extracty.fetch import Fetcher, FetchError, ResponseTooLarge
+from extracty.httpcache import HTTPCache
+from extracty.image import image_size, parse_image_size, _first_passing, \
+    ImageSizeError
+from extracty import extract_cover_image, extract_author
+from extracty.content import remove_bad_by_attrs, remove_bad_by_classifier
+from extracty.cache import ResultCache, ImageSizeCache, result_key
+from extracty.singleflight import SingleFlight, KeyLocks
+import extracty.app
+import extracty.fetch
+from extracty.utils import precedings, depth_first, text_stats, html_to_text, \
+    parse_html, \
+    parse_stream
 
 def doc(text):
     return lxml.etree.fromstring(text)
@@ -89,6 +123,16 @@ class PrecedingsTests(unittest.TestCase):
         self.assertIterateOver(d, '/doc/c/c1', ['c', 'a', 'doc'], skip=skip)
         self.assertIterateOver(d, '/doc/d', ['c1', 'c', 'a', 'doc'], skip=skip)
 
+    def test_deep(self):
+        d = e = lxml.etree.Element('doc')
+        for n in range(5000):
+            e = lxml.etree.SubElement(e, 'e%d' % n)
+        lxml.etree.SubElement(e, 'last')
+        found = [x.tag for x in precedings(e[0])]
+        self.assertEqual(len(found), 5001)
+        self.assertEqual(found[:2], ['e4999', 'e4998'])
+        self.assertEqual(found[-1], 'doc')
+
 class DepthFirstTests(unittest.TestCase):
 
     def assertIterateOver(self, e, tagnames, **kw):
@@ -128,3 +172,998 @@ class DepthFirstTests(unittest.TestCase):
         skip = lambda x: x.tag == 'c'
         self.assertIterateOver(d, ['doc', 'a', 'b', 'b1', 'b2', 'd'],
                 skip=skip)
+
+    def test_deep(self):
+        d = e = lxml.etree.Element('doc')
+        for n in range(5000):
+            e = lxml.etree.SubElement(e, 'e%d' % n)
+        found = [x.tag for x in depth_first(d)]
+        self.assertEqual(found, ['doc'] + ['e%d' % n for n in range(5000)])
+
+class StoplistRegistryTests(unittest.TestCase):
+
+    def test_loaded_once(self):
+        registry = StoplistRegistry()
+        stoplist = registry.get('English')
+        self.assertTrue(isinstance(stoplist, frozenset))
+        self.assertTrue(u'the' in stoplist)
+        self.assertTrue(registry.get('English') is stoplist)
+
+    def test_preload(self):
+        registry = StoplistRegistry()
+        self.assertEqual(registry.loaded(), [])
+        self.assertEqual(registry.memory_usage(), 0)
+        registry.preload(['English', 'German'])
+        self.assertEqual(sorted(registry.loaded()), ['English', 'German'])
+        self.assertTrue(registry.memory_usage() > 0)
+
+    def test_module_functions(self):
+        self.assertTrue('English' in justext.get_stoplists())
+        self.assertTrue(
+            justext.get_stoplist('English') is justext.get_stoplist('English'))
+
+class MakeParagraphsTests(unittest.TestCase):
+
+    def test_elements(self):
+        d = doc('''
+        <html>
+            <body>
+                <div>first<p>second</p>third</div>
+                <div>fourth<br/><br/>fifth</div>
+            </body>
+        </html>
+        ''')
+        ps = make_paragraphs(d)
+        self.assertEqual(
+            [p['text'] for p in ps],
+            ['first', 'second', 'third', 'fourth', 'fifth'])
+        self.assertEqual(
+            [p['element'].tag for p in ps],
+            ['div', 'p', 'div', 'div', 'br'])
+        self.assertEqual(
+            [p['xpath'] for p in ps], [
+                '/html[1]/body[1]/div[1]',
+                '/html[1]/body[1]/div[1]/p[1]',
+                '/html[1]/body[1]/div[1]',
+                '/html[1]/body[1]/div[2]',
+                '/html[1]/body[1]/div[2]/br[2]',
+                ])
+        for p in ps:
+            self.assertTrue(d.xpath(p['xpath'])[0] is p['element'])
+
+    def test_dict_access(self):
+        d = doc('<html><body><p>one <b>two</b> three</p><p>four</p></body></html>')
+        p1, p2 = make_paragraphs(d)
+        self.assertEqual(p1['text'], 'one two three')
+        self.assertEqual(p1['text_nodes'], ['one', 'two', 'three'])
+        self.assertEqual(p2['text'], 'four')
+        self.assertEqual(p1['word_count'], 3)
+        self.assertEqual(p1.get('class'), None)
+        self.assertFalse('class' in p1)
+        p1['class'] = 'good'
+        self.assertEqual(p1['class'], 'good')
+        self.assertEqual(p1.class_, 'good')
+        self.assertTrue('class' in p1)
+        self.assertRaises(KeyError, lambda: p1['unknown'])
+
+def _revise_by_scanning(paragraphs, max_heading_distance):
+    """ Context-sensitive classification scanning from each paragraph, the
+    way it was done before neighbours were computed in linear sweeps"""
+    for paragraph in paragraphs:
+        paragraph['class'] = paragraph['cfclass']
+
+    def _near_good(i):
+        j = i + 1
+        distance = 0
+        while j < len(paragraphs) and distance <= max_heading_distance:
+            if paragraphs[j]['class'] == 'good':
+                return True
+            distance += len(paragraphs[j]['text'])
+            j += 1
+        return False
+
+    for i, paragraph in enumerate(paragraphs):
+        if paragraph['heading'] and paragraph['class'] == 'short' and \
+                _near_good(i):
+            paragraph['class'] = 'neargood'
+
+    new_classes = {}
+    for i, paragraph in enumerate(paragraphs):
+        if paragraph['class'] != 'short':
+            continue
+        prev_neighbour = get_prev_neighbour(i, paragraphs, True)
+        next_neighbour = get_next_neighbour(i, paragraphs, True)
+        neighbours = set((prev_neighbour, next_neighbour))
+        if neighbours == set(['good']):
+            new_classes[i] = 'good'
+        elif neighbours == set(['bad']):
+            new_classes[i] = 'bad'
+        elif (prev_neighbour == 'bad' and
+                get_prev_neighbour(i, paragraphs, False) == 'neargood') or \
+             (next_neighbour == 'bad' and
+                get_next_neighbour(i, paragraphs, False) == 'neargood'):
+            new_classes[i] = 'good'
+        else:
+            new_classes[i] = 'bad'
+    for i, c in new_classes.iteritems():
+        paragraphs[i]['class'] = c
+
+    for i, paragraph in enumerate(paragraphs):
+        if paragraph['class'] != 'neargood':
+            continue
+        if (get_prev_neighbour(i, paragraphs, True),
+                get_next_neighbour(i, paragraphs, True)) == ('bad', 'bad'):
+            paragraph['class'] = 'bad'
+        else:
+            paragraph['class'] = 'good'
+
+    for i, paragraph in enumerate(paragraphs):
+        if paragraph['heading'] and paragraph['class'] == 'bad' and \
+                paragraph['cfclass'] != 'bad' and _near_good(i):
+            paragraph['class'] = 'good'
+
+class ReviseClassificationTests(unittest.TestCase):
+
+    def test_same_as_scanning(self):
+        r = random.Random(42)
+        classes = ('good', 'bad', 'short', 'neargood')
+        for _ in range(30000):
+            specs = [
+                (r.choice(classes), r.random() < 0.3, r.randint(0, 120))
+                for _ in range(r.randint(0, 12))]
+            def paragraphs():
+                return [
+                    {'cfclass': c, 'heading': heading, 'text': 'x' * length}
+                    for c, heading, length in specs]
+            expected = paragraphs()
+            _revise_by_scanning(expected, 200)
+            found = paragraphs()
+            revise_paragraph_classification(found, 200)
+            self.assertEqual(
+                [p['class'] for p in found], [p['class'] for p in expected])
+
+class TextStatsTests(unittest.TestCase):
+
+    def test_simple(self):
+        d = doc('''
+        <doc>
+            <a> some   text <b>and <c>more</c></b>  tail </a>
+            <d><img/></d>
+            <e>  <f/>  </e>
+        </doc>
+        ''')
+        stats = text_stats(d)
+        for el in d.iter():
+            (length, has_text, _) = stats[el]
+            self.assertEqual(length, len(html_to_text(el)))
+            self.assertEqual(has_text, bool(html_to_text(el)))
+        self.assertEqual(
+            [x.tag for x in d.iter() if stats[x][2]],
+            ['doc', 'd', 'img'])
+
+class RemoveBadTests(unittest.TestCase):
+
+    def test_by_attrs(self):
+        d = lxml.html.fromstring('''
+        <div>
+            <div class="footer">
+                <div><p class="entry">Kept in bad</p></div>
+                <p>Kept around good</p>
+            </div>
+            <div class="comment">
+                <p>Removed</p>
+                <div class="popup"><span>Removed</span></div>
+            </div>
+            <div class="article">
+                <p class="meta">Removed in good</p>
+                <p>Kept</p>
+            </div>
+        </div>
+        ''')
+        remove_bad_by_attrs(d)
+        self.assertEqual(html_to_text(d), 'Kept in bad Kept around good Kept')
+        self.assertEqual(len(d.find_class('footer')), 1)
+
+    def test_by_classifier(self):
+        d = lxml.html.fromstring('''
+        <div id="root">
+            <div id="outer">Bad text around
+                <div id="inner"><p id="good">Good</p></div>
+            </div>
+            <div id="sibling">
+                <p id="bad">Bad</p>
+                <p id="neargood">Neither</p>
+            </div>
+        </div>
+        ''')
+        paragraphs = [
+            {'element': d.get_element_by_id(id), 'class': cls}
+            for id, cls in [('outer', 'bad'), ('good', 'good'),
+                ('sibling', 'bad'), ('bad', 'bad'), ('neargood', 'short')]]
+        remove_bad_by_classifier(d, paragraphs)
+        # ancestors of a good paragraph survive, bad subtrees don't
+        self.assertEqual([el.get('id') for el in d.iter()],
+            ['root', 'outer', 'inner', 'good'])
+
+@unittest.skipIf(batch is None, 'NumPy is not available')
+class BatchClassificationTests(unittest.TestCase):
+
+    def paragraphs(self):
+        return [
+            {'text': u'short', 'dom_path': 'html.body.p',
+                'word_count': 1, 'linked_char_count': 0},
+            {'text': u'linked', 'dom_path': 'html.body.p',
+                'word_count': 1, 'linked_char_count': 6},
+            {'text': u'a heading', 'dom_path': 'html.body.h1',
+                'word_count': 2, 'linked_char_count': 0},
+            {'text': u'choice', 'dom_path': 'html.body.select.option',
+                'word_count': 1, 'linked_char_count': 0},
+            {'text': u'the and of ' * 25, 'dom_path': 'html.body.p',
+                'word_count': 75, 'linked_char_count': 0},
+            {'text': u'the and of word ' * 5, 'dom_path': 'html.body.p',
+                'word_count': 20, 'linked_char_count': 0},
+            {'text': u'\xa9 ' + u'word ' * 20, 'dom_path': 'html.body.p',
+                'word_count': 21, 'linked_char_count': 0},
+            {'text': u'word ' * 20, 'dom_path': 'html.body.div',
+                'word_count': 20, 'linked_char_count': 0},
+            ]
+
+    def test_same_as_classify_paragraphs(self):
+        stoplist = justext.get_stoplist('English')
+        expected = self.paragraphs()
+        classify_paragraphs(expected, stoplist)
+        documents = [self.paragraphs(), [], self.paragraphs()[2:]]
+        batch.classify_documents(documents, stoplist)
+        self.assertEqual(documents[0], expected)
+        self.assertEqual(documents[2], expected[2:])
+        self.assertEqual(
+            [p['cfclass'] for p in expected],
+            ['short', 'bad', 'short', 'bad', 'good', 'neargood', 'bad', 'bad'])
+
+    def test_classify_batch(self):
+        stoplist = justext.get_stoplist('English')
+        columns = batch.paragraph_columns(
+            [self.paragraphs()[:4], self.paragraphs()[4:]], stoplist)
+        classes = batch.classify_batch(columns)
+        self.assertEqual(len(classes), 2)
+        self.assertEqual(
+            [batch.CLASSES[c] for c in classes[0]],
+            ['short', 'bad', 'short', 'bad'])
+        self.assertEqual(
+            [batch.CLASSES[c] for c in classes[1]],
+            ['good', 'neargood', 'bad', 'bad'])
+
+class ParseStreamTests(unittest.TestCase):
+
+    html = (
+        '<html><head><title>Title</title>'
+        '<meta name="author" content="Author"></head>'
+        '<body>%s</body></html>' % ('<p>paragraph</p>' * 1000))
+
+    def test_full(self):
+        fp = StringIO(self.html)
+        doc, data, complete = parse_stream(fp, chunk_size=64)
+        self.assertTrue(complete)
+        self.assertEqual(data, self.html)
+        self.assertEqual(len(doc.findall('body/p')), 1000)
+
+    def test_head_only(self):
+        fp = StringIO(self.html)
+        doc, data, complete = parse_stream(fp, head_only=True, chunk_size=64)
+        self.assertFalse(complete)
+        self.assertTrue(len(data) < 200)
+        self.assertEqual(fp.tell(), len(data))
+        self.assertEqual(doc.findtext('head/title'), 'Title')
+        self.assertEqual(doc.find('body'), None)
+
+    def test_head_only_short_document(self):
+        html = '<title>Title</title>'
+        doc, data, complete = parse_stream(StringIO(html), head_only=True)
+        self.assertTrue(complete)
+        self.assertEqual(data, html)
+        self.assertEqual(doc.findtext('head/title'), 'Title')
+
+class ExtractFieldsTests(unittest.TestCase):
+
+    html = '''
+    <html>
+        <head>
+            <title>Title</title>
+            <meta name="author" content="Head Author">
+            <meta property="og:image" content="/image.jpg">
+        </head>
+        <body>
+            <span itemprop="author">Body Author</span>
+            <p>Some text</p>
+        </body>
+    </html>
+    '''
+
+    def test_fields(self):
+        metadata = extract(self.html, 'http://example.com/',
+            fields=['title', 'cover_image'])
+        self.assertEqual(metadata, {
+            'url': 'http://example.com/',
+            'title': 'Title',
+            'cover_image': 'http://example.com/image.jpg',
+            })
+
+    def test_unknown_fields(self):
+        self.assertRaises(ValueError,
+            extract, self.html, 'http://example.com/', fields=['date'])
+
+    def test_head_fast_path(self):
+        metadata = extract(self.html, 'http://example.com/',
+            fields=['author', 'cover_image'])
+        self.assertEqual(metadata['author'], 'Head Author')
+        metadata = extract(self.html, 'http://example.com/')
+        self.assertEqual(metadata['author'], 'Body Author')
+
+    def test_title_from_body(self):
+        # title is cleaned against headings in the body
+        html = self.html.replace('<title>Title</title>',
+            '<title>Site Name | Big News Today</title>').replace(
+            '<p>Some text</p>', '<h1>Big News Today</h1><p>Some text</p>')
+        for fields in (None, ['title'], ['title', 'cover_image']):
+            metadata = extract(html, 'http://example.com/', fields=fields)
+            self.assertEqual(metadata['title'], 'Big News Today')
+        metadata = extract(html, 'http://example.com/', content=False)
+        self.assertEqual(metadata['title'], 'Big News Today')
+
+    def test_no_head(self):
+        html = ('<body><div class=author>By John Smith</div><p>hi</p>'
+            '</body>')
+        metadata = extract(html, 'http://example.com/', fields=['author'])
+        self.assertEqual(metadata['author'], 'John Smith')
+
+    def test_head_only_meta(self):
+        # the head alone is searched only for <meta> tags, heuristics and
+        # microdata are left to the full document
+        html = ('<html><head><title>Written by the sea</title></head><body>'
+            '<span itemprop=author>Jane Doe</span><p>Text</p></body></html>')
+        for fields in (['author'], ['author', 'content']):
+            metadata = extract(html, 'http://example.com/', fields=fields)
+            self.assertEqual(metadata['author'], 'Jane Doe')
+
+    def test_head_fallback(self):
+        html = self.html.replace('<meta name="author" content="Head Author">', '')
+        metadata = extract(html, 'http://example.com/', fields=['author'])
+        self.assertEqual(metadata['author'], 'Body Author')
+
+class ExtractManyTests(unittest.TestCase):
+
+    items = [
+        ('<title>Page %d</title><p>Text</p>' % n, 'http://example.com/%d' % n)
+        for n in range(20)]
+
+    def test_ordered(self):
+        results = list(extract_many(self.items, workers=2, chunksize=3,
+            fields=['title']))
+        self.assertEqual([index for index, _, _ in results], range(20))
+        for index, metadata, error in results:
+            self.assertEqual(error, None)
+            self.assertEqual(metadata['title'], 'Page %d' % index)
+
+    def test_unordered(self):
+        results = list(extract_many(self.items, workers=2, chunksize=3,
+            ordered=False, fields=['title']))
+        self.assertEqual(sorted(index for index, _, _ in results), range(20))
+
+    def test_failures(self):
+        items = list(self.items[:3])
+        items[1] = (None, 'http://example.com/1')
+        results = list(extract_many(items, workers=2, chunksize=2,
+            fields=['title']))
+        self.assertEqual(results[0][1]['title'], 'Page 0')
+        self.assertEqual(results[1][1], None)
+        self.assertTrue(results[1][2])
+        self.assertEqual(results[2][1]['title'], 'Page 2')
+
+    def test_timeout(self):
+        original = extracty.extract
+        def extract(html, url, **options):
+            if html == 'hang':
+                time.sleep(60)
+            return original(html, url, **options)
+        items = list(self.items[:4])
+        items[1] = ('hang', 'http://example.com/1')
+        # workers are forked, so they see the patched function
+        extracty.extract = extract
+        try:
+            results = list(extract_many(items, workers=1, chunksize=4,
+                timeout=0.5, fields=['title']))
+        finally:
+            extracty.extract = original
+        self.assertEqual([index for index, _, _ in results], range(4))
+        self.assertTrue('timed out' in results[1][2])
+        self.assertEqual(
+            [metadata['title'] for _, metadata, _ in results if metadata],
+            ['Page 0', 'Page 2', 'Page 3'])
+
+    def test_worker_died(self):
+        original = extracty.extract
+        def extract(html, url, **options):
+            if html == 'crash':
+                os._exit(3)
+            return original(html, url, **options)
+        items = list(self.items)
+        items[5] = ('crash', 'http://example.com/5')
+        extracty.extract = extract
+        try:
+            for workers, chunksize in ((1, 1), (1, 4), (2, 3), (3, 16)):
+                results = list(extract_many(items, workers=workers,
+                    chunksize=chunksize, fields=['title']))
+                self.assertEqual(
+                    [index for index, _, _ in results], range(20))
+                self.assertTrue('exit code 3' in results[5][2])
+                for index, metadata, error in results:
+                    if index != 5:
+                        self.assertEqual(error, None)
+                        self.assertEqual(metadata['title'], 'Page %d' % index)
+        finally:
+            extracty.extract = original
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients drop connections on purpose
+        pass
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Serves pages from ``server.pages``, records client ports"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.server.requests.append(self.path)
+        if self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.server.not_modified += 1
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '4')
+            self.end_headers()
+            self.wfile.write('body')
+            return
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        page = self.server.pages.get(self.path)
+        if page is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', self.server.content_type)
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+class _ServerTestCase(unittest.TestCase):
+    """ Runs a local HTTP server for each test"""
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.clients = set()
+        self.server.requests = []
+        self.server.content_type = 'text/html'
+        self.server.not_modified = 0
+        self.server.pages = {
+            '/page': '<title>Page</title><p>Text</p>',
+            '/large': 'x' * 1000,
+            }
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.fetcher = Fetcher(max_per_host=2, connect_timeout=5,
+            read_timeout=5)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+class FetcherTests(_ServerTestCase):
+
+    def test_connection_reuse(self):
+        for _ in range(5):
+            self.assertEqual(self.fetcher.fetch(self.base + '/page'),
+                self.server.pages['/page'])
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_idle_limits(self):
+        fetcher = Fetcher(max_idle=3, max_idle_per_host=2, idle_timeout=0.2)
+        other = self.base.replace('127.0.0.1', 'localhost')
+        responses = [fetcher.open(self.base + '/page') for _ in range(3)] + \
+            [fetcher.open(other + '/page') for _ in range(2)]
+        for response in responses:
+            response.read()
+            response.close()
+        self.assertEqual(
+            sorted(len(idle) for idle in fetcher._idle.values()), [1, 2])
+        self.assertEqual(fetcher._idle_count, 3)
+        # idle connections expire and state of unused hosts goes with them
+        time.sleep(0.3)
+        fetcher.fetch(self.base + '/page')
+        self.assertEqual(len(self.server.clients), 6)
+        self.assertEqual(fetcher._idle_count, 1)
+        self.assertEqual(fetcher._idle.keys(), [('http', '127.0.0.1',
+            self.server.server_address[1])])
+        self.assertEqual(fetcher._host_slots.keys(), fetcher._idle.keys())
+        fetcher.close()
+        self.assertEqual(fetcher._host_slots, {})
+
+    def test_redirect(self):
+        response = self.fetcher.open(self.base + '/redirect')
+        self.assertEqual(response.url, self.base + '/page')
+        self.assertEqual(response.read(), self.server.pages['/page'])
+        response.close()
+
+    def test_charset(self):
+        self.server.pages['/page'] = '<title>\xc3\xa9</title>'
+        response = self.fetcher.open(self.base + '/page')
+        self.assertEqual(response.charset, None)
+        response.close()
+        self.server.content_type = 'text/html; charset="ISO-8859-1"'
+        response = self.fetcher.open(self.base + '/page')
+        self.assertEqual(response.charset, 'ISO-8859-1')
+        response.close()
+        self.assertEqual(
+            extract_url(self.base + '/page', fields=['title'],
+                fetcher=self.fetcher)['title'],
+            u'\xc3\xa9')
+
+    def test_extract_head_only(self):
+        self.server.pages['/page'] = (
+            '<html><head><title>Written by the sea</title>'
+            '<meta property="og:image" content="/image.jpg"></head><body>'
+            '<span itemprop=author>Jane Doe</span><p>Text</p></body></html>')
+        for fields in (['author'], ['author', 'content']):
+            metadata = extract_url(self.base + '/page', fields=fields,
+                fetcher=self.fetcher)
+            self.assertEqual(metadata['author'], 'Jane Doe')
+        metadata = extract_url(self.base + '/page', fields=['cover_image'],
+            fetcher=self.fetcher)
+        self.assertEqual(metadata['cover_image'], self.base + '/image.jpg')
+
+    def test_errors(self):
+        try:
+            self.fetcher.fetch(self.base + '/missing')
+        except FetchError, e:
+            self.assertEqual(e.status, 404)
+        else:
+            self.fail('FetchError is not raised')
+        self.assertRaises(ResponseTooLarge,
+            self.fetcher.fetch, self.base + '/large', max_size=100)
+        self.assertEqual(
+            len(self.fetcher.fetch(self.base + '/large', max_size=1000)), 1000)
+
+    def test_revalidation(self):
+        self.fetcher.cache = HTTPCache(self.tmp)
+        for _ in range(3):
+            self.assertEqual(self.fetcher.fetch(self.base + '/etag'), 'body')
+        self.assertEqual(self.server.not_modified, 2)
+        # responses without validators aren't cached
+        self.fetcher.fetch(self.base + '/page')
+        self.assertEqual(self.fetcher.cache.get(self.base + '/page'), None)
+
+    def test_extract_urls(self):
+        urls = [self.base + '/page', self.base + '/missing'] * 5
+        results = list(extract_urls(urls, workers=4, fetcher=self.fetcher,
+            fields=['title']))
+        self.assertEqual([index for index, _, _ in results], range(10))
+        for index, metadata, error in results:
+            if index % 2:
+                self.assertTrue('404' in error)
+            else:
+                self.assertEqual(metadata['title'], 'Page')
+        # no more connections than allowed per host
+        self.assertTrue(len(self.server.clients) <= 2)
+
+class HTTPCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_store(self):
+        cache = HTTPCache(self.tmp)
+        self.assertEqual(cache.get('http://example.com/'), None)
+        cache.store('http://example.com/', '"v1"', None, 'body\nbody')
+        entry = HTTPCache(self.tmp).get('http://example.com/')
+        self.assertEqual(entry.body, 'body\nbody')
+        self.assertEqual(entry.conditional_headers(), {'If-None-Match': '"v1"'})
+
+    def test_eviction(self):
+        cache = HTTPCache(self.tmp)
+        cache.store('http://example.com/0', None, 'date', 'x' * 50)
+        # room for three entries
+        cache.max_size = os.path.getsize(
+            cache._filename('http://example.com/0')) * 3
+        for n in range(3):
+            cache.store('http://example.com/%d' % n, None, 'date', 'x' * 50)
+            # make recency visible to mtime resolution
+            os.utime(cache._filename('http://example.com/%d' % n),
+                (n, n))
+        cache.touch('http://example.com/0')
+        cache.store('http://example.com/3', None, 'date', 'x' * 50)
+        self.assertNotEqual(cache.get('http://example.com/0'), None)
+        self.assertEqual(cache.get('http://example.com/1'), None)
+        self.assertNotEqual(cache.get('http://example.com/3'), None)
+
+    def test_shared_directory(self):
+        # instances in different processes share the total size
+        caches = [HTTPCache(self.tmp, max_size=10000) for _ in range(8)]
+        for n in range(80):
+            caches[n % 8].store(
+                'http://example.com/%d' % n, None, 'date', 'x' * 500)
+        sizes = [os.path.getsize(os.path.join(self.tmp, name))
+            for name in os.listdir(self.tmp) if not name.startswith('.')]
+        self.assertTrue(sum(sizes) <= 10000)
+        self.assertTrue(sum(sizes) > 10000 - 1000)
+        caches[0].clear()
+        self.assertEqual(os.listdir(self.tmp), ['.size'])
+        caches[1].store('http://example.com/0', None, 'date', 'x' * 500)
+        with open(os.path.join(self.tmp, '.size')) as f:
+            self.assertEqual(int(f.read()), os.path.getsize(
+                caches[1]._filename('http://example.com/0')))
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmp, 'results.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_key(self):
+        self.assertEqual(
+            result_key('http://example.com/', ['title', 'author']),
+            result_key('http://example.com/', set(['author', 'title'])))
+
+    def test_ttl(self):
+        self.cache.set('key', {'title': u'Title'})
+        self.assertEqual(self.cache.get('key'), {'title': u'Title'})
+        self.cache.ttl = 0
+        self.assertEqual(self.cache.get('key'), None)
+
+    def test_trim(self):
+        self.cache.max_entries = 2
+        for n in range(3):
+            self.cache.set('key%d' % n, n)
+        self.cache.trim()
+        self.assertEqual(
+            [self.cache.get('key%d' % n) for n in range(3)], [None, 1, 2])
+
+class AppTests(_ServerTestCase):
+
+    def setUp(self):
+        _ServerTestCase.setUp(self)
+        self.saved = extracty.app.result_cache, extracty.app.key_locks
+        extracty.app.result_cache = ResultCache(
+            os.path.join(self.tmp, 'results.db'))
+        extracty.app.key_locks = KeyLocks(os.path.join(self.tmp, 'locks'))
+
+    def tearDown(self):
+        extracty.app.result_cache, extracty.app.key_locks = self.saved
+        # let the server finish keep-alive connections of the app
+        extracty.fetch.default_fetcher().close()
+        _ServerTestCase.tearDown(self)
+
+    def request(self, query):
+        status = []
+        def start_response(s, headers):
+            status.append((s, dict(headers)))
+        body = extracty.app.application(
+            {'PATH_INFO': '/', 'QUERY_STRING': query}, start_response)
+        return status[0][0], status[0][1], ''.join(body)
+
+    def test_result_cache(self):
+        query = 'fields=title&url=%s/page' % self.base
+        status, headers, body = self.request(query)
+        self.assertEqual(headers['X-Extracty-Cache'], 'miss')
+        self.assertTrue('"Page"' in body)
+        status, headers, cached_body = self.request(query)
+        self.assertEqual(headers['X-Extracty-Cache'], 'hit')
+        self.assertEqual(cached_body, body)
+        status, headers, body = self.request('fields=date&url=x')
+        self.assertTrue(status.startswith('400'))
+
+class SingleFlightTests(unittest.TestCase):
+
+    def test_coalescing(self):
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'result'
+        results = []
+        def run():
+            results.append(flights.do('key', work))
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['result'] * 5)
+        # nothing in flight, next call does the work again
+        flights.do('key', work)
+        self.assertEqual(calls, [1, 1])
+
+    def test_errors(self):
+        flights = SingleFlight()
+        def fail():
+            raise ValueError('failed')
+        self.assertRaises(ValueError, flights.do, 'key', fail)
+
+class KeyLocksTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_lock(self):
+        locks = KeyLocks(self.tmp, timeout=0.2)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            with locks.lock('key'):
+                os.write(write_fd, 'x')
+                time.sleep(1)
+            os._exit(0)
+        os.read(read_fd, 1)
+        try:
+            with locks.lock('key') as acquired:
+                self.assertFalse(acquired)
+            with locks.lock('other key') as acquired:
+                self.assertTrue(acquired)
+        finally:
+            os.waitpid(pid, 0)
+        with locks.lock('key') as acquired:
+            self.assertTrue(acquired)
+
+def _image(format, size, **options):
+    from PIL import Image
+    f = StringIO()
+    Image.new('RGB', size).save(f, format, **options)
+    return f.getvalue()
+
+_article_text = ('This is a long paragraph of the article which is written in'
+    ' plain English, so that it is classified as good content by the'
+    ' classifier. It has to be long enough and it has to contain many of the'
+    ' most common words, which are there in the stoplist, and there is no'
+    ' doubt about it at all.')
+
+class ImageSizeTests(_ServerTestCase):
+
+    def test_parse(self):
+        formats = [('PNG', {}), ('GIF', {}), ('JPEG', {}),
+            ('JPEG', {'progressive': True})]
+        from PIL import features
+        if features.check('webp'):
+            formats += [('WEBP', {}), ('WEBP', {'lossless': True})]
+        for format, options in formats:
+            for size in [(1, 1), (123, 45), (700, 301)]:
+                data = _image(format, size, **options)
+                self.assertEqual(parse_image_size(data), size)
+                self.assertEqual(parse_image_size(data[:8]), None)
+
+    def test_unknown(self):
+        self.assertEqual(parse_image_size('<svg></svg>'), None)
+        self.assertEqual(parse_image_size(_image('BMP', (10, 10))), None)
+
+    def test_image_size(self):
+        self.server.pages['/image.jpg'] = _image('JPEG', (640, 480))
+        self.server.pages['/image.bmp'] = _image('BMP', (64, 48))
+        self.assertEqual(
+            image_size(self.base + '/image.jpg', fetcher=self.fetcher),
+            (640, 480))
+        # falls back to PIL
+        self.assertEqual(
+            image_size(self.base + '/image.bmp', fetcher=self.fetcher),
+            (64, 48))
+
+    def test_cache(self):
+        cache = ImageSizeCache(os.path.join(self.tmp, 'images.db'))
+        self.server.pages['/image.png'] = _image('PNG', (64, 48))
+        self.server.pages['/broken.png'] = 'broken'
+        for _ in range(2):
+            self.assertEqual(image_size(self.base + '/image.png',
+                fetcher=self.fetcher, cache=cache), (64, 48))
+            # failures come from cache as ImageSizeError
+            self.assertRaises((FetchError, ImageSizeError), image_size,
+                self.base + '/missing.png', fetcher=self.fetcher, cache=cache)
+            self.assertRaises(ImageSizeError, image_size,
+                self.base + '/broken.png', fetcher=self.fetcher, cache=cache)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 3})
+        self.assertEqual(cache.get(self.base + '/missing.png'),
+            (None, 'not_found'))
+        cache.ttls['not_found'] = 0
+        cache.set(self.base + '/missing.png', failure='not_found')
+        self.assertEqual(cache.get(self.base + '/missing.png'), None)
+
+    def test_min_image_size(self):
+        self.server.pages['/small.png'] = _image('PNG', (100, 100))
+        self.server.pages['/large.png'] = _image('PNG', (600, 400))
+        html = """
+            <meta property="og:image" content="/small.png">
+            <meta property="og:image" content="/missing.png">
+            <meta name="twitter:image" content="/large.png">
+            """
+        image = extract_cover_image(html, self.base + '/', fetcher=self.fetcher,
+            min_image_size=(300, 200))
+        self.assertEqual(image, self.base + '/large.png')
+
+    def test_meta_before_heuristics(self):
+        self.server.pages['/large.png'] = _image('PNG', (600, 400))
+        html = """
+            <meta property="og:image" content="/large.png">
+            <img src="/small.png"><p>%s</p>
+            """ % _article_text
+        ctx = Context(html)
+        image = extract_cover_image(ctx, self.base + '/', fetcher=self.fetcher,
+            min_image_size=(300, 200))
+        self.assertEqual(image, self.base + '/large.png')
+        # no jusText pass when an image from <meta> is big enough
+        self.assertEqual(ctx._paragraphs, None)
+        self.assertEqual(self.server.requests, ['/large.png'])
+
+    def test_heuristics(self):
+        self.server.pages['/small.png'] = _image('PNG', (100, 100))
+        self.server.pages['/large1.png'] = _image('PNG', (600, 400))
+        self.server.pages['/large2.png'] = _image('PNG', (600, 400))
+        # images collected walking back from each good paragraph to the
+        # previous one: small, large1, large2
+        html = """
+            <html><body>
+            <img src="/small.png"><p>%(text)s</p>
+            <div><img src="/large1.png"></div><p>%(text)s</p>
+            <img src="/large2.png"><p>%(text)s</p>
+            </body></html>
+            """ % {'text': _article_text}
+        image = extract_cover_image(html, self.base + '/')
+        self.assertEqual(image, self.base + '/small.png')
+        image = extract_cover_image(html, self.base + '/', fetcher=self.fetcher,
+            min_image_size=(300, 200), probe_workers=1)
+        self.assertEqual(image, self.base + '/large1.png')
+        self.assertEqual(len(self.server.requests), 2)
+
+class ArticleHeuristicsTests(unittest.TestCase):
+
+    def test_author_specializes_parent(self):
+        html = """
+            <div class="byline">Posted by <span class="author">Alice Cooper
+            </span> on Monday</div><p>%s</p>
+            """ % _article_text
+        self.assertEqual(extract_author(html), 'Alice Cooper')
+
+    def test_author_replaces_containing_candidates(self):
+        # a candidate replaces any earlier one which contains its text, not
+        # only its ancestors
+        html = """
+            <p class="byline">by Alice Cooper and Bob</p>
+            <span class="author">Alice Cooper</span><p>%s</p>
+            """ % _article_text
+        self.assertEqual(extract_author(html), 'Alice Cooper')
+
+class FirstPassingTests(unittest.TestCase):
+
+    def check(self, delays):
+        """ Check which passes or fails after a delay"""
+        checked = []
+        def check(candidate):
+            checked.append(candidate)
+            passed, delay = delays[candidate]
+            time.sleep(delay)
+            return passed
+        return check, checked
+
+    def test_priority(self):
+        check, _ = self.check({
+            'a': (False, 0.1), 'b': (True, 0.1), 'c': (True, 0)})
+        self.assertEqual(_first_passing(['a', 'b', 'c'], check), 'b')
+        check, _ = self.check({'a': (False, 0), 'b': (False, 0)})
+        self.assertEqual(_first_passing(['a', 'b'], check), None)
+
+    def test_cancellation(self):
+        check, checked = self.check({
+            'a': (True, 0.1), 'b': (True, 0), 'c': (True, 0)})
+        self.assertEqual(_first_passing(['a', 'b', 'c'], check, workers=1),
+            'a')
+        self.assertEqual(checked, ['a'])
+
+    def test_timeout(self):
+        check, _ = self.check({'a': (True, 2), 'b': (True, 0)})
+        started = time.time()
+        self.assertEqual(
+            _first_passing(['a', 'b'], check, timeout=0.2), 'b')
+        self.assertTrue(time.time() - started < 1)
+
+class MetaIndexTests(unittest.TestCase):
+
+    html = """
+    <html>
+        <head>
+            <meta name="Title" content="1">
+            <meta property="og:title" content="2">
+            <meta name="title" content="3">
+            <link rel="author" href="/me">
+        </head>
+        <body>
+            <input name="title">
+            <span itemprop="author">Author</span>
+            <a rel="author" href="/me">Me</a>
+            <p>Some text</p>
+        </body>
+    </html>
+    """
+
+    def test_find(self):
+        meta = Context(self.html).meta
+        self.assertEqual(
+            [el.get('content') for el in meta.find('name', 'title', 'Title')],
+            ['1', '3'])
+        self.assertEqual(
+            [el.tag for el in meta.find('rel', 'author')], ['link', 'a'])
+        self.assertEqual(
+            [el.tag for el in meta.find('itemprop', 'author')], ['span'])
+        self.assertEqual(meta.find('name', 'author'), [])
+
+    def test_built_before_paragraphs(self):
+        ctx = Context(self.html)
+        ctx.paragraphs
+        self.assertEqual(len(ctx.meta.find('property', 'og:title')), 1)
+
+class DecodeTests(unittest.TestCase):
+
+    title = u'\u0417\u0430\u0433\u043e\u043b\u043e\u0432\u043e\u043a'
+
+    def test_http_charset(self):
+        html = (u'<title>%s</title>' % self.title).encode('cp1251')
+        metadata = extract(html, 'http://example.com/', fields=['title'],
+            charset='windows-1251')
+        self.assertEqual(metadata['title'], self.title)
+        # unknown charset is ignored, UTF-8 is the default
+        html = (u'<title>%s</title>' % self.title).encode('utf8')
+        doc = parse_html(html, charset='x-unknown')
+        self.assertEqual(doc.findtext('.//title'), self.title)
+
+    def test_sniffing(self):
+        html = (
+            u'<meta charset="windows-1251"><title>%s</title>' % self.title
+            ).encode('cp1251')
+        self.assertEqual(parse_html(html).findtext('.//title'), self.title)
+        self.assertEqual(
+            justext.decode_html(' ' * justext.core.SNIFF_SIZE + html),
+            (' ' * justext.core.SNIFF_SIZE + html).decode('utf8', 'replace'))